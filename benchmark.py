@@ -0,0 +1,459 @@
+"""
+Benchmarks for the hot paths of the INA Ripper: database loading and saving,
+indexed reads, memory usage, entry serialization, cleaning, text comparison,
+media scoring and HTML parsing. Everything runs offline, on synthetic
+databases and on the recorded fixture pages. Results are written as JSON, to
+compare them between versions.
+
+Usage:
+    python benchmark.py [suite] [option]*
+"""
+
+
+import os
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+from ina.factory import BinaryOption, Factory
+from ina.database import InaEntry, MediaCandidate, load_database,\
+    save_database, clean
+from ina.scoring import is_vectorized, score_entries, text_token_ids
+from ina.tools import slugify, tokenize, jaccard
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PAGES = [
+    ("results.html", "result_table",
+     lambda soup: soup.find("div", {"id": "result-tableau-1"}).find_all("tr")),
+    ("notice.html", "credits",
+     lambda soup: soup.find("td", {"id": "GEN"})),
+    ("youtube_results.html", "media",
+     lambda soup: soup.find_all("div", {"class": "yt-lockup-video"})),
+]
+
+COLLECTIONS = [
+    "Les Maîtres du mystère",
+    "Les maîtres du mystère",
+    "Le Masque et la Plume",
+    "Théâtre de l'étrange",
+    "Les Nuits de France Culture",
+    "L'Heure du crime",
+]
+
+WORDS = [
+    "le", "crime", "de", "la", "rue", "Morgue", "mort", "rouge", "homme",
+    "nuit", "scarabée", "d'or", "lettre", "volée", "chat", "noir", "puits",
+    "pendule", "chute", "maison", "Usher", "portrait", "ovale", "cœur",
+    "révélateur", "mystère", "été", "ténèbres", "château", "forêt",
+]
+
+
+def synthetic_entry(rand, i, n_titles):
+    """Return a plausible enriched entry, with titles repeated so that the
+       database contains duplicates
+    """
+    title_rand = random.Random(i % n_titles)
+    entry = InaEntry()
+    entry.title = " ".join(title_rand.choice(WORDS) for _ in range(5))
+    entry.category.collection = title_rand.choice(COLLECTIONS)
+    entry.category.program = "Fiction radiophonique"
+    entry.category.genre = "Radio"
+    entry.diffusion.channel = "France Inter"
+    if rand.random() > .05:
+        entry.diffusion.date = "%02d/%02d/%d" % (
+            rand.randint(1, 28), rand.randint(1, 12), rand.randint(1950, 1999))
+        entry.diffusion.time = "%02d:%02d:00" % (
+            rand.randint(0, 23), rand.randint(0, 59))
+    else:
+        entry.diffusion.date = ""
+        entry.diffusion.time = ""
+    entry.diffusion.extract_datetime()
+    entry.credits.link = "http://inatheque.ina.fr/notice?id=PHD%08d" % i
+    entry.credits.text = "AUT,%s %s ; REA,%s %s ;" % tuple(
+        rand.choice(WORDS) for _ in range(4))
+    entry.credits.extract_text()
+    entry.media.video_ids = [MediaCandidate(
+        duration=rand.randint(600, 4000),
+        title=" ".join(rand.choice(WORDS) for _ in range(6)),
+        video_id="%011x" % rand.getrandbits(44),
+        duration_error=rand.random(),
+        title_error=rand.random(),
+    ) for _ in range(rand.randint(0, 3))]
+    entry.attributes.duration_raw = "00:%02d:%02d:00" % (
+        rand.randint(10, 59), rand.randint(0, 59))
+    entry.attributes.extract_duration()
+    return entry
+
+
+def synthetic_entries(size, seed=0):
+    """Return a list of synthetic entries, a fifth of them being duplicates"""
+    rand = random.Random(seed)
+    return [synthetic_entry(rand, i, max(1, 4 * size // 5))
+            for i in range(size)]
+
+
+def write_database(path, entries):
+    """Write entries to a TSV database"""
+    with open(path, "w") as file:
+        file.write(InaEntry.HEADER + "\n")
+        for entry in entries:
+            file.write(entry.serial() + "\n")
+
+
+def database_options(path, **kwargs):
+    """Return the options of the database actions, for a database path"""
+    options = {
+        "database": path,
+        "filter-collections": set(),
+        "skip-confirmation": True,
+        "streaming": False,
+        "index": False,
+        "copy-unchanged": False,
+    }
+    options.update(kwargs)
+    return options
+
+
+def measure(function, repeat, setup=None):
+    """Call a function several times, and return the best and mean times in
+       seconds. The setup function, if any, is called before each run and
+       is not timed.
+    """
+    timings = list()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        logging.disable(logging.INFO)
+        try:
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        finally:
+            logging.disable(logging.NOTSET)
+    return {
+        "best": min(timings),
+        "mean": sum(timings) / len(timings),
+        "repeat": repeat,
+    }
+
+
+def record(results, suite, name, timing, **kwargs):
+    """Add a timing to the results, and log it"""
+    timing.update(kwargs)
+    timing.update({"suite": suite, "name": name})
+    results.append(timing)
+    logging.info(
+        "%s %s %s: %.3f ms",
+        suite,
+        name,
+        " ".join("%s=%s" % item for item in sorted(kwargs.items())),
+        1000 * timing["best"]
+    )
+
+
+def clear_caches():
+    """Clear the caches of the text functions"""
+    slugify.cache_clear()
+    tokenize.cache_clear()
+    text_token_ids.cache_clear()
+
+
+def bench_database(options, results, directory):
+    """Time loading and saving TSV and JSON lines databases of various
+       sizes
+    """
+    for size in options["sizes"]:
+        source = os.path.join(directory, "database-%d.tsv" % size)
+        write_database(source, synthetic_entries(size))
+        for extension in ["tsv", "jsonl"]:
+            path = os.path.join(directory, "database-%d.%s" % (size, extension))
+            db_options = database_options(path)
+            database = load_database(dict(db_options, database=source))
+            if path != source:
+                save_database(db_options, database)
+
+            def load():
+                database.update(load_database(db_options))
+
+            record(results, "database", "load_database",
+                   measure(load, options["repeat"]),
+                   size=size, bytes=os.path.getsize(path), format=extension)
+            record(results, "database", "save_database",
+                   measure(lambda: save_database(db_options, database),
+                           options["repeat"]),
+                   size=size, format=extension)
+            if path != source:
+                os.remove(path)
+        os.remove(source)
+
+
+def bench_index(options, results, directory):
+    """Time reading a single collection and a single entry of TSV databases
+       of various sizes, by parsing every row and through the index
+    """
+    from ina.index import TsvIndex, build_index
+    for size in options["sizes"]:
+        path = os.path.join(directory, "database-%d.tsv" % size)
+        entries = synthetic_entries(size)
+        write_database(path, entries)
+        slug = slugify(COLLECTIONS[-1])
+        key = entries[size // 2].key()
+        for index in [False, True]:
+            db_options = database_options(
+                path, **{"filter-collections": {slug}, "index": index})
+            record(results, "index", "load_collection",
+                   measure(lambda: load_database(db_options, filtered=True),
+                           options["repeat"]),
+                   size=size, index=index)
+        record(results, "index", "build_index",
+               measure(lambda: build_index(path), options["repeat"]),
+               size=size)
+        with TsvIndex(path) as index:
+            record(results, "index", "get",
+                   measure(lambda: index.get(key), options["repeat"]),
+                   size=size)
+        os.remove(path)
+        os.remove(path + ".index")
+
+
+def bench_memory(options, results, directory):
+    """Measure the memory held by loaded databases of various sizes"""
+    for size in options["sizes"]:
+        path = os.path.join(directory, "database-%d.tsv" % size)
+        write_database(path, synthetic_entries(size))
+        db_options = database_options(path)
+        clear_caches()
+        logging.disable(logging.INFO)
+        tracemalloc.start()
+        try:
+            database = load_database(db_options)
+            memory = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+            logging.disable(logging.NOTSET)
+        del database
+        results.append({
+            "suite": "memory",
+            "name": "load_database",
+            "size": size,
+            "bytes": memory,
+            "bytes_per_entry": memory / size,
+        })
+        logging.info("memory load_database size=%d: %.0f bytes per entry "
+                     "(%.0f MB per million entries)",
+                     size, memory / size, memory / size)
+        os.remove(path)
+
+
+def bench_serial(options, results, _):
+    """Time the serialization round-trip of entries, and the decoding of
+       their sub-records, which from_serial defers to their first access
+    """
+    for size in options["sizes"]:
+        entries = synthetic_entries(size)
+        serials = [entry.serial() for entry in entries]
+        read = list()
+
+        def from_serial():
+            del read[:]
+            for serial in serials:
+                read.append(InaEntry.from_raw(serial))
+
+        def decode():
+            for entry in read:
+                for record in InaEntry.RECORDS:
+                    record.__get__(entry, InaEntry)
+
+        record(results, "serial", "serial",
+               measure(lambda: [entry.serial() for entry in entries],
+                       options["repeat"]),
+               size=size)
+        record(results, "serial", "from_serial",
+               measure(from_serial, options["repeat"]),
+               size=size)
+        record(results, "serial", "decode",
+               measure(decode, options["repeat"], setup=from_serial),
+               size=size)
+        record(results, "serial", "serial_untouched",
+               measure(lambda: [entry.serial() for entry in read],
+                       options["repeat"], setup=from_serial),
+               size=size)
+
+
+def bench_clean(options, results, directory):
+    """Time the clean action, which removes duplicates from a database, in
+       memory and streaming
+    """
+    for size in options["sizes"]:
+        source = os.path.join(directory, "source-%d.tsv" % size)
+        path = os.path.join(directory, "database-%d.tsv" % size)
+        write_database(source, synthetic_entries(size))
+        for streaming in [False, True]:
+            clean_options = database_options(path, streaming=streaming)
+            record(results, "clean", "clean",
+                   measure(lambda: clean(clean_options), options["repeat"],
+                           setup=lambda: shutil.copyfile(source, path)),
+                   size=size, streaming=streaming)
+        os.remove(source)
+        os.remove(path)
+
+
+def bench_text(options, results, _):
+    """Time the slugify and jaccard functions over entry and media titles"""
+    for size in options["sizes"]:
+        entries = synthetic_entries(size)
+        titles = [entry.title for entry in entries]
+        pairs = [
+            (entry.category.collection + " " + entry.title, video_id["title"])
+            for entry in entries
+            for video_id in entry.media.video_ids
+        ]
+        timing = measure(lambda: [slugify(title) for title in titles],
+                         options["repeat"])
+        timing["per_second"] = len(titles) / timing["best"]
+        record(results, "text", "slugify", timing, size=len(titles))
+        timing = measure(lambda: [jaccard(*pair) for pair in pairs],
+                         options["repeat"])
+        timing["per_second"] = len(pairs) / timing["best"]
+        record(results, "text", "jaccard", timing, size=len(pairs))
+
+
+def bench_scoring(options, results, _):
+    """Time the scoring of the media candidates of whole collections, with
+       and without NumPy: first from cold caches, as in a new process, then
+       scoring again the largest collection
+    """
+    backends = [False]
+    if is_vectorized():
+        backends.append(True)
+    for size in options["sizes"]:
+        collections = dict()
+        for entry in synthetic_entries(size):
+            collections.setdefault(
+                slugify(entry.category.collection), list()).append(entry)
+        largest = max(collections.values(), key=len)
+        candidates = sum(len(entry.media.video_ids)
+                         for entries in collections.values()
+                         for entry in entries)
+        for vectorized in backends:
+            def score():
+                for entries in collections.values():
+                    score_entries(entries, vectorized)
+            timing = measure(score, options["repeat"], setup=clear_caches)
+            timing["per_second"] = candidates / timing["best"]
+            record(results, "scoring", "score_entries", timing,
+                   size=size, candidates=candidates, vectorized=vectorized)
+            timing = measure(lambda: score_entries(largest, vectorized),
+                             options["repeat"],
+                             setup=lambda: score_entries(largest, vectorized))
+            record(results, "scoring", "rescore_collection", timing,
+                   size=len(largest), vectorized=vectorized)
+
+
+def bench_parsing(options, results, _):
+    """Time the scraping of a result page, and the parsing of each fixture
+       page with each installed parser, with and without strainers
+    """
+    from ina.extraction import STRAINERS, scrap_result_page
+    from ina.parsing import available_parsers, make_soup
+    with open(os.path.join(FIXTURES, "results.html"), "r") as file:
+        html = file.read()
+    record(results, "parsing", "scrap_result_page",
+           measure(lambda: list(scrap_result_page(html)), options["repeat"]),
+           page="results.html")
+    for filename, strainer, finder in PAGES:
+        with open(os.path.join(FIXTURES, filename), "r") as file:
+            html = file.read()
+        for parser in available_parsers():
+            for only in [None, STRAINERS[strainer]]:
+                record(results, "parsing", "make_soup",
+                       measure(lambda: finder(make_soup(html, only, parser)),
+                               options["repeat"]),
+                       page=filename,
+                       parser=parser,
+                       strainer=strainer if only is not None else None)
+
+
+SUITES = {
+    "database": bench_database,
+    "index": bench_index,
+    "memory": bench_memory,
+    "serial": bench_serial,
+    "clean": bench_clean,
+    "text": bench_text,
+    "scoring": bench_scoring,
+    "parsing": bench_parsing,
+}
+
+
+def get_revision():
+    """Return the current git revision of the repository, if any"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options, suites):
+    """Run benchmark suites, and write their results as JSON"""
+    results = list()
+    with tempfile.TemporaryDirectory() as directory:
+        for name in suites:
+            logging.info("Running %s benchmarks", name)
+            SUITES[name](options, results, directory)
+    report = {
+        "revision": get_revision(),
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": options["sizes"],
+        "results": results,
+    }
+    with open(options["output"], "w") as file:
+        json.dump(report, file, indent=4)
+    logging.info("Wrote %d results to %s",
+                 len(results), os.path.abspath(options["output"]))
+
+
+def make_action(names):
+    """Return an action running the given suites"""
+    def action(options):
+        run(options, names)
+    action.__doc__ = "Run the %s benchmark suite%s" % (
+        ", ".join(names), "s" if len(names) > 1 else "")
+    return action
+
+
+class Benchmark(Factory):
+    """Factory extension for the benchmarks"""
+
+    def __init__(self):
+        actions = {"all": make_action(list(SUITES))}
+        for name in SUITES:
+            actions[name] = make_action([name])
+        Factory.__init__(self, [
+            BinaryOption("n", "sizes", [10000, 100000],
+                         lambda x: list(map(int, x.split(" ")))),
+            BinaryOption("r", "repeat", 3, int),
+            BinaryOption("o", "output", "benchmark.json"),
+        ], actions)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s\t%(levelname)s\t%(message)s",
+        level=logging.INFO
+    )
+    Benchmark().start()
@@ -0,0 +1,84 @@
+"""
+Stand-in HTTP server that serves the recorded fixture pages instead of
+inatheque.ina.fr and YouTube, to run the scraping and the enrichment offline.
+
+Usage:
+    python fixtures/server.py [port]
+
+Then point the actions to it with the resolve option:
+    python ina.py enrich -H "inatheque.ina.fr=http://127.0.0.1:8000 www.youtube.com=http://127.0.0.1:8000"
+"""
+
+
+import os
+import sys
+import logging
+import socketserver
+import http.server
+
+
+FIXTURES = os.path.dirname(os.path.abspath(__file__))
+
+ROUTES = [
+    ("/results", "youtube_results.html"),
+    ("/recherche", "results.html"),
+    ("/notice", "notice.html"),
+    ("/", "search.html"),
+]
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """Serve the fixture page matching the request path, keeping the
+       connection alive between requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        """Answer a POST request with a fixture page, ignoring its body"""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def do_GET(self):
+        """Answer a GET request with a fixture page"""
+        for prefix, filename in ROUTES:
+            if self.path.startswith(prefix):
+                break
+        with open(os.path.join(FIXTURES, filename), "rb") as file:
+            body = file.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info("%s %s", self.address_string(), format % args)
+
+
+class FixtureServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Threaded HTTP server for the fixture pages"""
+
+    daemon_threads = True
+
+
+def main():
+    """Main module function"""
+    logging.basicConfig(
+        format="%(asctime)s\t%(levelname)s\t%(message)s",
+        level=logging.INFO
+    )
+    port = 8000
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    server = FixtureServer(("127.0.0.1", port), FixtureHandler)
+    logging.info("Serving fixtures from %s on port %d", FIXTURES, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,11 @@
 
 import logging
 from ina.extraction import scrap, enrich
-from ina.database import clean
+from ina.database import clean, convert
 from ina.download import download
-from ina.database import select_media
+from ina.database import select_media, score
 from ina.factory import UnaryOption, BinaryOption, Factory
+from ina.instrument import instrumented
 
 
 class InaRipper(Factory):
@@ -15,24 +16,54 @@ class InaRipper(Factory):
     def __init__(self):
         Factory.__init__(self, [
             BinaryOption("q", "query", ""),
+            BinaryOption("f", "query-file", ""),
             BinaryOption("c", "filter-collections", set(),
                          lambda x: set(x.split(" "))),
             BinaryOption("d", "database", "database.tsv"),
+            BinaryOption("o", "output", "database.sqlite"),
             UnaryOption("y", "skip-confirmation", False),
+            UnaryOption("S", "streaming", False),
+            UnaryOption("I", "index", False),
+            UnaryOption("U", "copy-unchanged", False),
             BinaryOption("w", "delay", 1.5, float),
+            BinaryOption("n", "min-delay", .25, float),
+            BinaryOption("N", "max-delay", 30, float),
+            BinaryOption("j", "workers", 1, int),
+            BinaryOption("T", "timeout", 30, float),
+            BinaryOption("R", "retries", 3, int),
+            BinaryOption("P", "pipeline-depth", 1, int),
+            BinaryOption("H", "resolve", dict(),
+                         lambda x: dict(pair.split("=", 1)
+                                        for pair in x.split(" "))),
+            BinaryOption("C", "cache-directory", ".ina-cache"),
+            BinaryOption("L", "cache-ttl", 604800, int),
+            BinaryOption("Z", "cache-size", 500, int),
+            UnaryOption("O", "offline", False),
+            BinaryOption("s", "scraper", "http"),
+            BinaryOption("x", "html-parser", ""),
             BinaryOption("e", "driver-executable-path",
                          "/usr/local/bin/geckodriver"),
             UnaryOption("a", "append", False),
+            UnaryOption("i", "incremental", False),
+            UnaryOption("r", "resume", False),
+            BinaryOption("k", "checkpoint-interval", 10, int),
             BinaryOption("p", "max-page-requests", 300, int),
             BinaryOption("m", "max-media-candidates", 2, int),
+            UnaryOption("g", "global-assignment", False),
             BinaryOption("t", "title-error-threshold", .5, float),
             BinaryOption("u", "duration-error-threshold", .05, float),
+            BinaryOption("l", "report", ""),
         ], {
-            "scrap": scrap,
-            "clean": clean,
-            "enrich": enrich,
-            "download": download,
-            "select_media": select_media
+            name: instrumented(name, action)
+            for name, action in [
+                ("scrap", scrap),
+                ("clean", clean),
+                ("enrich", enrich),
+                ("download", download),
+                ("select_media", select_media),
+                ("score", score),
+                ("convert", convert),
+            ]
         })
 
 
@@ -0,0 +1,98 @@
+""" Cache module
+
+Provides an on-disk cache for HTTP responses. Responses are stored in files
+named after the hash of their URL, expire after a given time to live, and the
+least recently used ones are evicted when the cache grows over its size
+limit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from ina.fetch import Response
+
+
+class ResponseCache:
+    """On-disk cache of HTTP responses, keyed by URL. A time to live of zero
+       means that responses never expire.
+    """
+
+    def __init__(self, directory, ttl=0, max_size=0):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        for path in self._iter_paths():
+            self.size += os.path.getsize(path)
+        logging.debug("Response cache at %s holds %d bytes",
+                      os.path.abspath(self.directory), self.size)
+
+    def _iter_paths(self):
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(".tmp"):
+                    yield os.path.join(root, filename)
+
+    def path(self, url):
+        """Return the path of the file caching the response for a URL"""
+        digest = hashlib.sha1(url.encode("utf8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, url, ignore_ttl=False):
+        """Return the cached response for a URL, or None if it is missing or
+           expired. Expired responses are still returned if ignore_ttl is set.
+        """
+        path = self.path(url)
+        try:
+            stat = os.stat(path)
+            if self.ttl > 0 and not ignore_ttl\
+                    and time.time() - stat.st_mtime > self.ttl:
+                return None
+            with open(path, "rb") as file:
+                meta = json.loads(file.readline().decode("utf8"))
+                body = file.read()
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (OSError, ValueError):
+            return None
+        return Response(meta["url"], meta["status"], meta["headers"], body)
+
+    def put(self, url, response):
+        """Store the response for a URL, evicting old responses if needed"""
+        path = self.path(url)
+        meta = json.dumps({
+            "url": response.url,
+            "status": response.status,
+            "headers": response.headers,
+        }).encode("utf8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "%s.%d.tmp" % (path, threading.get_ident())
+        with open(temp_path, "wb") as file:
+            file.write(meta + b"\n")
+            file.write(response.body)
+        with self.lock:
+            if os.path.isfile(path):
+                self.size -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.size += os.path.getsize(path)
+            if self.max_size > 0 and self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used responses until the cache is back
+           to three quarters of its size limit
+        """
+        paths = sorted(self._iter_paths(), key=lambda p: os.stat(p).st_atime)
+        removed = 0
+        for path in paths:
+            if self.size <= .75 * self.max_size:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size -= size
+            removed += 1
+        logging.debug("Evicted %d responses from the cache", removed)
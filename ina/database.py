@@ -9,9 +9,14 @@ import logging
 import time
 import re
 import os
+import sys
 import json
 from functools import total_ordering
-from ina.tools import slugify
+from ina.instrument import timed
+from ina.matching import assign_media
+from ina.scoring import MANUAL_INPUT, score_entries, rank_entries,\
+    is_accepted
+from ina.tools import slugify, atomic_writer
 
 
 class EntryParsingException(Exception):
@@ -28,6 +33,8 @@ class EntryDiffusion:
         "diffusion_channel"
     ]
 
+    __slots__ = ["date", "time", "channel", "datetime"]
+
     def __init__(self):
         self.date = None
         self.time = None
@@ -46,8 +53,8 @@ class EntryDiffusion:
     def from_serial(self, split):
         """Recreates the object from its serialization"""
         self.date = split[0]
-        self.time = split[1]
-        self.channel = split[3]
+        self.time = sys.intern(split[1])
+        self.channel = sys.intern(split[3])
         self.extract_datetime()
 
     def extract_datetime(self):
@@ -80,6 +87,15 @@ class EntryCategory:
         "genre"
     ]
 
+    __slots__ = [
+        "collection",
+        "collection_title",
+        "track_number",
+        "track_total",
+        "program",
+        "genre"
+    ]
+
     def __init__(self):
         self.collection = None
         self.collection_title = None
@@ -101,14 +117,14 @@ class EntryCategory:
 
     def from_serial(self, split):
         """Recreates the object from its serialization"""
-        self.collection = split[0]
-        self.collection_title = split[1]
+        self.collection = sys.intern(split[0])
+        self.collection_title = sys.intern(split[1])
         if split[2] != "None":
             self.track_number = int(split[2])
         if split[3] != "None":
             self.track_total = int(split[3])
-        self.program = split[4]
-        self.genre = split[5]
+        self.program = sys.intern(split[4])
+        self.genre = sys.intern(split[5])
 
 
 class EntryCredits:
@@ -116,6 +132,8 @@ class EntryCredits:
 
     HEADER = ["link", "text", "author", "director"]
 
+    __slots__ = ["link", "text", "author", "director"]
+
     def __init__(self):
         self.link = None
         self.text = None
@@ -147,23 +165,77 @@ class EntryCredits:
             self.director = " ".join(reversed(search_results[0].split(" ")))
 
 
+class MediaCandidate:
+    """Candidate video for the media of an entry. Fields can also be accessed
+       as dictionary items, as candidates used to be stored as dictionaries.
+    """
+
+    __slots__ = [
+        "duration",
+        "title",
+        "video_id",
+        "duration_error",
+        "title_error"
+    ]
+
+    def __init__(self, video_id=None, title=None, duration=None,
+                 title_error=None, duration_error=None):
+        self.duration = duration
+        self.title = title
+        self.video_id = video_id
+        self.duration_error = duration_error
+        self.title_error = title_error
+
+    def __repr__(self):
+        return "<MediaCandidate; video_id: \"%s\"; title: \"%s\">" % (
+            self.video_id,
+            self.title
+        )
+
+    def __getitem__(self, key):
+        if key not in MediaCandidate.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in MediaCandidate.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def keys(self):
+        """Return the field names, so that dict(candidate) works"""
+        return list(MediaCandidate.__slots__)
+
+    def from_dict(self, data):
+        """Recreates the object from its dictionary representation"""
+        for key in MediaCandidate.__slots__:
+            setattr(self, key, data.get(key))
+
+
 class EntryMedia:
     """Entry media information"""
 
     HEADER = ["media"]
 
+    __slots__ = ["video_ids"]
+
     def __init__(self):
         self.video_ids = list()
 
     def serial(self, delimiter="\t"):
         """Serialize the object"""
-        return json.dumps(self.video_ids).replace(delimiter, "")
+        return json.dumps([dict(video_id) for video_id in self.video_ids])\
+            .replace(delimiter, "")
 
     def from_serial(self, split):
         """Recreates the object from its serialization"""
         if len("".join(split)) == 0:
             return
-        self.video_ids = json.loads(split[0])
+        self.video_ids = list()
+        for data in json.loads(split[0]):
+            video_id = MediaCandidate()
+            video_id.from_dict(data)
+            self.video_ids.append(video_id)
 
 
 class EntryAttributes:
@@ -171,6 +243,8 @@ class EntryAttributes:
 
     HEADER = ["duration_raw", "duration"]
 
+    __slots__ = ["duration_raw", "duration"]
+
     def __init__(self):
         self.duration_raw = None
         self.duration = None
@@ -196,6 +270,39 @@ class EntryAttributes:
             self.duration += base * int(factor)
 
 
+class LazyRecord:
+    """Descriptor for a sub-record of an entry, only decoded from the raw
+       serialization of the entry on first access, and stored in a private
+       slot
+    """
+
+    def __init__(self, slot, factory, start, end):
+        self.slot = slot
+        self.factory = factory
+        self.start = start
+        self.end = end
+
+    def __get__(self, entry, owner):
+        if entry is None:
+            return self
+        record = getattr(entry, self.slot)
+        if record is None:
+            record = self.factory()
+            record.from_serial(entry.raw_split()[self.start:self.end])
+            setattr(entry, self.slot, record)
+        return record
+
+    def __set__(self, entry, record):
+        setattr(entry, self.slot, record)
+
+
+def datetime_sort_key(value):
+    """Return a key sorting diffusion datetimes, the empty ones last"""
+    if value == "":
+        return (1, None)
+    return (0, value)
+
+
 @total_ordering
 class InaEntry:
     """Main entry representation object"""
@@ -209,13 +316,38 @@ class InaEntry:
         + EntryAttributes.HEADER
     )
 
+    __slots__ = [
+        "title",
+        "title_slug",
+        "title_slug_source",
+        "raw",
+        "_category",
+        "_diffusion",
+        "_credits",
+        "_media",
+        "_attributes"
+    ]
+
+    RECORDS = [
+        LazyRecord("_category", EntryCategory, 1, 7),
+        LazyRecord("_diffusion", EntryDiffusion, 7, 11),
+        LazyRecord("_credits", EntryCredits, 11, 15),
+        LazyRecord("_media", EntryMedia, 15, 16),
+        LazyRecord("_attributes", EntryAttributes, 16, 18),
+    ]
+
+    category, diffusion, credits, media, attributes = RECORDS
+
     def __init__(self):
         self.title = None
-        self.category = EntryCategory()
-        self.diffusion = EntryDiffusion()
-        self.credits = EntryCredits()
-        self.media = EntryMedia()
-        self.attributes = EntryAttributes()
+        self.title_slug = None
+        self.title_slug_source = None
+        self.raw = None
+        self._category = EntryCategory()
+        self._diffusion = EntryDiffusion()
+        self._credits = EntryCredits()
+        self._media = EntryMedia()
+        self._attributes = EntryAttributes()
 
     def __str__(self):
         return "<InaEntry; title: \"%s\"; collection: \"%s\">" % (
@@ -224,39 +356,97 @@ class InaEntry:
         )
 
     def __hash__(self):
-        return hash(slugify(self.title))
+        return hash(self.slug())
 
     def __eq__(self, other):
-        return slugify(self.title) == slugify(other.title)\
+        return self.slug() == other.slug()\
             and self.category.collection_title == other.category.collection_title
 
     def __lt__(self, other):
-        if self.diffusion.datetime == "":
-            return False
-        if other.diffusion.datetime == "":
-            return True
-        return self.diffusion.datetime < other.diffusion.datetime
+        return self.sort_key() < other.sort_key()
+
+    def slug(self):
+        """Return the slug of the title, only computed again if the title
+           changed
+        """
+        if self.title_slug_source is not self.title:
+            self.title_slug = slugify(self.title)
+            self.title_slug_source = self.title
+        return self.title_slug
+
+    def collection_slug(self):
+        """Return the slug of the collection, read from the raw serialization
+           if the category was not decoded
+        """
+        if self.raw is not None and self._category is None:
+            return slugify(self.raw[0].split(self.raw[1], 2)[1])
+        return slugify(self.category.collection)
+
+    def sort_key(self):
+        """Return the key entries are sorted by"""
+        return datetime_sort_key(self.diffusion.datetime)
 
     def serial(self, delimiter="\t"):
-        """Serialize the object"""
-        return delimiter.join(map(str, [
-            self.title,
-            self.category.serial(delimiter),
-            self.diffusion.serial(delimiter),
-            self.credits.serial(delimiter),
-            self.media.serial(delimiter),
-            self.attributes.serial(delimiter),
-        ]))
+        """Serialize the object. Sub-records that were never accessed since
+           the entry was read are written back as they were read.
+        """
+        if self.raw is None:
+            return delimiter.join(map(str, [
+                self.title,
+                self.category.serial(delimiter),
+                self.diffusion.serial(delimiter),
+                self.credits.serial(delimiter),
+                self.media.serial(delimiter),
+                self.attributes.serial(delimiter),
+            ]))
+        if delimiter == self.raw[1] and self.is_untouched():
+            return self.raw[0]
+        split = self.raw_split()
+        fields = [str(self.title)]
+        for record in InaEntry.RECORDS:
+            value = getattr(self, record.slot)
+            if value is None:
+                fields.append(delimiter.join(split[record.start:record.end]))
+            else:
+                fields.append(value.serial(delimiter))
+        return delimiter.join(fields)
 
-    def from_serial(self, serial, delimiter="\t"):
-        """Recreates the object from its serialization"""
-        split = serial.split(delimiter)
-        self.title = split[0]
-        self.category.from_serial(split[1:7])
-        self.diffusion.from_serial(split[7:11])
-        self.credits.from_serial(split[11:15])
-        self.media.from_serial(split[15:16])
-        self.attributes.from_serial(split[16:18])
+    def from_serial(self, serial, delimiter="\t", source=None, offset=None):
+        """Recreates the object from its serialization. Sub-records are only
+           decoded when first accessed. The file the row was read from (see
+           file_source) and its offset in it, if known, allow saving it again
+           by copying it.
+        """
+        self.raw = serial, delimiter, source, offset
+        self.title = serial.split(delimiter, 1)[0]
+        for record in InaEntry.RECORDS:
+            setattr(self, record.slot, None)
+
+    @classmethod
+    def from_raw(cls, serial, delimiter="\t", source=None, offset=None):
+        """Return a new entry recreated from its serialization (see
+           from_serial), without building the sub-records first
+        """
+        entry = cls.__new__(cls)
+        entry.title_slug = None
+        entry.title_slug_source = None
+        entry.from_serial(serial, delimiter, source, offset)
+        return entry
+
+    def raw_split(self):
+        """Return the fields of the serialization the entry was read from"""
+        return self.raw[0].split(self.raw[1])
+
+    def is_untouched(self):
+        """Return whether the entry was read from a serialization, and
+           neither its title was changed nor its sub-records accessed since
+        """
+        if self.raw is None:
+            return False
+        for record in InaEntry.RECORDS:
+            if getattr(self, record.slot) is not None:
+                return False
+        return self.title == self.raw[0].split(self.raw[1], 1)[0]
 
     def parse(self, row):
         """Extract entry information from search results row soup"""
@@ -286,21 +476,311 @@ class InaEntry:
             self.title
         ))
 
+    def key(self):
+        """Return a key identifying the entry across database rewrites"""
+        return (
+            slugify(self.category.collection),
+            self.slug(),
+            str(self.diffusion.datetime)
+        )
+
+
+class EntryJournal:
+    """Append-only journal of the entries processed by a long action, so that
+       the action can be resumed after a crash or an interruption
+    """
+
+    def __init__(self, path, checkpoint_interval=10):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.file = None
+        self.pending = 0
+
+    def read(self):
+        """Return the journaled entries, indexed by their key"""
+        entries = dict()
+        if not os.path.isfile(self.path):
+            return entries
+        with open(self.path, "r") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    logging.warning("Ignoring truncated line in journal %s",
+                                    os.path.abspath(self.path))
+                    break
+                entry = InaEntry.from_raw(line.strip())
+                try:
+                    for record in InaEntry.RECORDS:
+                        record.__get__(entry, InaEntry)
+                    entries[entry.key()] = entry
+                except (IndexError, ValueError):
+                    logging.warning("Ignoring invalid line in journal %s",
+                                    os.path.abspath(self.path))
+        return entries
+
+    def truncate(self, block_size=4096):
+        """Cut the journal after its last complete line, dropping the line
+           torn by a crash, if any
+        """
+        with open(self.path, "rb+") as file:
+            end = file.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - block_size)
+                file.seek(start)
+                position = file.read(end - start).rfind(b"\n")
+                if position >= 0:
+                    end = start + position + 1
+                    break
+                end = start
+            file.truncate(end)
+
+    def open(self, resume=False):
+        """Open the journal, keeping its current content if resuming"""
+        if resume and os.path.isfile(self.path):
+            self.truncate()
+        self.file = open(self.path, "a" if resume else "w")
+        self.pending = 0
+
+    def append(self, entry):
+        """Append an entry to the journal, checkpointing if needed"""
+        self.file.write(entry.serial() + "\n")
+        self.pending += 1
+        if self.pending >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make sure journaled entries are written to the disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        """Checkpoint and close the journal"""
+        if self.file is not None:
+            self.checkpoint()
+            self.file.close()
+            self.file = None
 
-def load_database(options):
-    """Load an entry database"""
+    def remove(self):
+        """Delete the journal once its entries are saved in the database"""
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+SQLITE_EXTENSIONS = [".sqlite", ".sqlite3", ".db"]
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+JSONL_EXTENSIONS = [".jsonl", ".ndjson"]
+
+
+def database_format(path):
+    """Return the storage format of a database. Existing files are sniffed
+       from their first bytes, others are guessed from their path.
+    """
+    if os.path.isfile(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as file:
+            start = file.read(len(SQLITE_MAGIC))
+        if start == SQLITE_MAGIC:
+            return "sqlite"
+        if start.startswith(b"{"):
+            return "jsonl"
+        return "tsv"
+    extension = os.path.splitext(path)[1].lower()
+    if extension in SQLITE_EXTENSIONS:
+        return "sqlite"
+    if extension in JSONL_EXTENSIONS:
+        return "jsonl"
+    return "tsv"
+
+
+def file_source(path, stat=None):
+    """Return the identity of a database file as it is now: its absolute
+       path, its size and its modification time
+    """
+    if stat is None:
+        stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def iter_entries(path, collections=None):
+    """Lazily parse the entries of a database file, row by row. If a set of
+       collection slugs is given, rows from other collections are skipped
+       before being parsed.
+    """
+    with open(path, "rb") as file:
+        source = file_source(path, os.fstat(file.fileno()))
+        offset = len(file.readline())
+        for line in file:
+            entry_serial = line.decode("utf8").strip()
+            row_offset, offset = offset, offset + len(line)
+            if collections is not None:
+                slug = slugify(entry_serial.split("\t", 2)[1])
+                if slug not in collections:
+                    continue
+            entry = InaEntry.from_raw(entry_serial, source=source,
+                                      offset=row_offset)
+            yield entry
+
+
+def row_slug(line):
+    """Return the collection slug of a TSV row, given as bytes"""
+    return slugify(line.split(b"\t", 2)[1].decode("utf8"))
+
+
+def scan_rows(path, slugs):
+    """Return the byte ranges of the rows of the given collection slugs in a
+       TSV database, as (offset, length) tuples. They are read from the index
+       of the database if it is up to date, otherwise every row is scanned.
+    """
+    from ina.index import collection_ranges
+    ranges = collection_ranges(path, slugs)
+    if ranges is not None:
+        return ranges
+    ranges = {slug: list() for slug in slugs}
+    with open(path, "rb") as file:
+        offset = len(file.readline())
+        for line in file:
+            slug = row_slug(line)
+            if slug in ranges:
+                ranges[slug].append((offset, len(line)))
+            offset += len(line)
+    return ranges
+
+
+def coalesce(ranges):
+    """Merge contiguous byte ranges, so that they are copied at once"""
+    merged = list()
+    for offset, length in ranges:
+        if len(merged) > 0 and sum(merged[-1]) == offset:
+            merged[-1] = merged[-1][0], merged[-1][1] + length
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+def is_unchanged(entries, source, ranges):
+    """Return whether a collection of entries holds exactly the rows at the
+       given byte ranges of a file, untouched and in the same order. The
+       entries must have been read from that very file, which must not have
+       changed since (see file_source).
+    """
+    if len(entries) != len(ranges):
+        return False
+    for entry, (offset, _) in zip(entries, ranges):
+        if not entry.is_untouched() or entry.raw[2] != source\
+                or entry.raw[3] != offset:
+            return False
+    return True
+
+
+def write_entries(path, database, partial=False, copy_unchanged=False):
+    """Write a database to a TSV file, and return the number of lines
+       written. If partial, the database only holds some of the collections,
+       and the rows of the other ones are kept as they are. If copy_unchanged,
+       collections whose entries are the untouched rows of the existing file,
+       read from it as it is now, are copied from it instead of being
+       serialized. The file is written to a temporary file first, then renamed
+       over the existing one.
+    """
+    exists = os.path.isfile(path)
+    source, ranges = None, dict()
+    if exists and copy_unchanged:
+        source = file_source(path)
+        ranges = scan_rows(path, database)
+    counts = {"lines": 1, "copied": 0}
+    placed = set()
+    with atomic_writer(path) as file:
+
+        def place(slug):
+            placed.add(slug)
+            if slug in ranges\
+                    and is_unchanged(database[slug], source, ranges[slug]):
+                with open(path, "rb") as old:
+                    for offset, length in coalesce(ranges[slug]):
+                        old.seek(offset)
+                        chunk = old.read(length)
+                        file.write(chunk)
+                        if not chunk.endswith(b"\n"):
+                            file.write(b"\n")
+                counts["lines"] += len(ranges[slug])
+                counts["copied"] += 1
+                return
+            for entry in database[slug]:
+                file.write((entry.serial() + "\n").encode("utf8"))
+            counts["lines"] += len(database[slug])
+
+        file.write((InaEntry.HEADER + "\n").encode("utf8"))
+        if partial and exists:
+            with open(path, "rb") as old:
+                old.readline()
+                for line in old:
+                    slug = row_slug(line)
+                    if slug not in database:
+                        file.write(line.rstrip(b"\n") + b"\n")
+                        counts["lines"] += 1
+                    elif slug not in placed:
+                        place(slug)
+        for slug in database:
+            if slug not in placed:
+                place(slug)
+    if counts["copied"] > 0:
+        logging.info("Copied %d unchanged collections", counts["copied"])
+    return counts["lines"]
+
+
+def append_entries(path, entries):
+    """Append entries to a TSV file, creating it with its header first if
+       needed, and return the number of lines written
+    """
+    exists = os.path.isfile(path) and os.path.getsize(path) > 0
+    with open(path, "a", encoding="utf8") as file:
+        if not exists:
+            file.write(InaEntry.HEADER + "\n")
+        for entry in entries:
+            file.write(entry.serial() + "\n")
+    return len(entries)
+
+
+def iter_indexed_entries(path, collections):
+    """Read the entries of some collections of a TSV database through its
+       index, only decoding their rows
+    """
+    from ina.index import TsvIndex
+    with TsvIndex(path) as index:
+        for slug in sorted(collections):
+            yield from index.collection(slug)
+
+
+@timed("database_load")
+def load_database(options, filtered=False):
+    """Load an entry database. If filtered, only the collections specified
+       in the options are loaded.
+    """
     logging.info("Loading database at %s",
                  os.path.abspath(options["database"]))
+    collections = None
+    if filtered and len(options["filter-collections"]) > 0:
+        collections = options["filter-collections"]
+        logging.info("Only loading collections %s",
+                     ", ".join(sorted(collections)))
+    if database_format(options["database"]) == "sqlite":
+        from ina import sqlite
+        entries = sqlite.iter_entries(options["database"], collections)
+    elif database_format(options["database"]) == "jsonl":
+        from ina import jsonl
+        entries = jsonl.iter_entries(options["database"], collections)
+    elif options["index"] and collections is not None:
+        entries = iter_indexed_entries(options["database"], collections)
+    else:
+        entries = iter_entries(options["database"], collections)
     n_entries = 0
     database = dict()
-    with open(options["database"], "r") as file:
-        for entry_serial in file.readlines()[1:]:
-            entry = InaEntry()
-            entry.from_serial(entry_serial.strip())
-            n_entries += 1
-            slug = slugify(entry.category.collection)
-            database.setdefault(slug, list())
-            database[slug].append(entry)
+    for entry in entries:
+        n_entries += 1
+        slug = entry.collection_slug()
+        database.setdefault(slug, list())
+        database[slug].append(entry)
     logging.info(
         "Loaded %d entries in the database, organized in %d collections",
         n_entries,
@@ -309,29 +789,112 @@ def load_database(options):
     return database
 
 
-def save_database(options, database):
-    """Save an entry database"""
-    logging.info("Saving database at %s", os.path.abspath(options["database"]))
+def load_keys(options, filtered=False):
+    """Return the set of the keys of the entries of the database (see
+       InaEntry.key). TSV rows are not parsed, their keys are read from
+       their fields.
+    """
+    keys = set()
+    collections = None
+    if filtered and len(options["filter-collections"]) > 0:
+        collections = options["filter-collections"]
+    if not os.path.isfile(options["database"]):
+        return keys
+    if database_format(options["database"]) == "sqlite":
+        from ina import sqlite
+        for entry in sqlite.iter_entries(options["database"], collections):
+            keys.add(entry.key())
+    elif database_format(options["database"]) == "jsonl":
+        from ina import jsonl
+        for entry in jsonl.iter_entries(options["database"], collections):
+            keys.add(entry.key())
+    else:
+        with open(options["database"], "r") as file:
+            file.readline()
+            for line in file:
+                split = line.strip().split("\t")
+                slug = slugify(split[1])
+                if collections is None or slug in collections:
+                    keys.add((slug, slugify(split[0]), split[9]))
+    logging.info("Loaded %d entry keys from %s",
+                 len(keys), os.path.abspath(options["database"]))
+    return keys
+
+
+def confirm_reset(options):
+    """Ask for a confirmation before resetting the database, unless it is
+       skipped in the options
+    """
     if not options["skip-confirmation"] and os.path.isfile(options["database"]):
         validation = input(
             "This action will reset the database at %s, continue? (y/n) "
             % os.path.abspath(options["database"])
         )
         if validation.lower() != "y":
-            return
-    i = 1
-    with open(options["database"], "w") as file:
-        file.write(InaEntry.HEADER + "\n")
-        for slug in database:
-            for entry in database[slug]:
-                i += 1
-                file.write(entry.serial() + "\n")
+            return False
+    return True
+
+
+@timed("database_save")
+def save_database(options, database, partial=False):
+    """Save an entry database, and return whether it was saved. If partial,
+       the database only holds some of the collections, and the other ones
+       are left untouched.
+    """
+    logging.info("Saving database at %s", os.path.abspath(options["database"]))
+    if not confirm_reset(options):
+        return False
+    if database_format(options["database"]) == "sqlite":
+        from ina import sqlite
+        i = sqlite.save_entries(options["database"], database, partial)
+        logging.info("Wrote %d rows to %s", i,
+                     os.path.abspath(options["database"]))
+        return True
+    if database_format(options["database"]) == "jsonl":
+        from ina import jsonl
+        i = jsonl.save_entries(options["database"], database, partial)
+        logging.info("Wrote %d records to %s", i,
+                     os.path.abspath(options["database"]))
+        return True
+    i = write_entries(options["database"], database, partial,
+                      options["copy-unchanged"])
     logging.info("Wrote %d lines to %s", i,
                  os.path.abspath(options["database"]))
+    if options["index"]:
+        from ina.index import build_index
+        build_index(options["database"])
+    return True
+
+
+def append_database(options, entries):
+    """Append entries to a database, in its storage format, creating it if
+       it does not exist, and return the number of entries written
+    """
+    if database_format(options["database"]) == "sqlite":
+        from ina import sqlite
+        return sqlite.append_entries(options["database"], entries)
+    if database_format(options["database"]) == "jsonl":
+        from ina import jsonl
+        return jsonl.append_entries(options["database"], entries)
+    return append_entries(options["database"], entries)
+
+
+def convert(options):
+    """Copy the database to the output path, converting its format"""
+    database = load_database(options)
+    save_database(dict(options, database=options["output"]), database)
 
 
 def clean(options):
-    """Remove duplicates and select collection title"""
+    """Remove duplicates and select collection title. Of duplicate entries,
+       the first one is kept.
+    """
+    if options["streaming"]:
+        if database_format(options["database"]) == "tsv":
+            from ina import dedup
+            dedup.clean(options)
+            return
+        logging.warning("Streaming clean only works on TSV databases")
     database = load_database(options)
     collection_titles = dict()
     for slug in database:
@@ -348,9 +911,14 @@ def clean(options):
         for entry in database[slug]:
             entry.category.collection_title = collection_title
         original_size = len(database[slug])
-        database[slug] = list(set(database[slug]))
+        unique, seen = list(), set()
+        for entry in database[slug]:
+            if entry.slug() not in seen:
+                seen.add(entry.slug())
+                unique.append(entry)
+        database[slug] = unique
         new_size = len(database[slug])
-        database[slug].sort()
+        database[slug].sort(key=InaEntry.sort_key)
         for i, entry in enumerate(database[slug]):
             entry.category.track_number = i + 1
             entry.category.track_total = new_size
@@ -365,16 +933,14 @@ def clean(options):
 
 
 def select_entry_media(options, entry, allocated):
-    """Select the best media source for one entry"""
-    entry.media.video_ids.sort(
-        key=lambda d: (d["title_error"], d["duration_error"])
-    )
+    """Select the best media source for one entry, among its candidates
+       ranked best first
+    """
     for video_id in entry.media.video_ids[:options["max-media-candidates"]]:
         if video_id["video_id"] in allocated:
             continue
         url = "http://www.youtube.com/watch?v=" + video_id["video_id"]
-        if video_id["title_error"] < options["title-error-threshold"]\
-                and video_id["duration_error"] < options["duration-error-threshold"]:
+        if is_accepted(options, video_id):
             return video_id
         table = [
             ["Source", "Title", "Collection", "Duration"], [
@@ -405,13 +971,17 @@ def select_entry_media(options, entry, allocated):
 
 def select_media(options):
     """Select the best media source with user interaction"""
-    database = load_database(options)
+    database = load_database(options, filtered=True)
     collection_filters = set(database)
     if len(options["filter-collections"]) > 0:
         collection_filters = options["filter-collections"]
     allocated = set()
     for slug in collection_filters:
         logging.info("Selection media for collection %s", slug)
+        rank_entries(database[slug])
+        assignment = dict()
+        if options["global-assignment"]:
+            assignment = assign_media(options, database[slug], allocated)
         for i, entry in enumerate(database[slug]):
             filename = entry.filename()
             logging.info(
@@ -423,7 +993,10 @@ def select_media(options):
                 len(database[slug]),
                 filename + ".mp3"
             )
-            selected_id = select_entry_media(options, entry, allocated)
+            if i in assignment:
+                selected_id = assignment[i]
+            else:
+                selected_id = select_entry_media(options, entry, allocated)
             if selected_id is None:
                 while True:
                     manual_input = input("Please provide the correct video id: ")
@@ -432,16 +1005,45 @@ def select_media(options):
                         entry.media.video_ids = list()
                         break
                     if len(manual_input) == 11:
-                        entry.media.video_ids = [{
-                            "video_id": manual_input,
-                            "title": "MANUAL_INPUT",
-                            "duration": 0,
-                            "title_error": 0,
-                            "duration_error": 0
-                        }]
+                        entry.media.video_ids = [MediaCandidate(
+                            video_id=manual_input,
+                            title=MANUAL_INPUT,
+                            duration=0,
+                            title_error=0,
+                            duration_error=0
+                        )]
                         break
                     print("Please enter a correct video id (or leave it empty).")
             else:
                 entry.media.video_ids = [selected_id]
                 allocated.add(selected_id["video_id"])
-    save_database(options, database)
+    save_database(options, database, partial=True)
+
+
+def score(options):
+    """Score again the media candidates of selected collections, and rank
+       them, without fetching anything
+    """
+    database = load_database(options, filtered=True)
+    for slug in sorted(database):
+        start = time.time()
+        score_entries(database[slug])
+        rank_entries(database[slug])
+        counts = {"accepted": 0, "ambiguous": 0, "missing": 0}
+        for entry in database[slug]:
+            if len(entry.media.video_ids) == 0:
+                counts["missing"] += 1
+            elif is_accepted(options, entry.media.video_ids[0]):
+                counts["accepted"] += 1
+            else:
+                counts["ambiguous"] += 1
+        logging.info(
+            "Scored collection %s in %.3f seconds: %d entries accepted, "
+            "%d ambiguous, %d without media",
+            slug,
+            time.time() - start,
+            counts["accepted"],
+            counts["ambiguous"],
+            counts["missing"]
+        )
+    save_database(options, database, partial=True)
@@ -0,0 +1,139 @@
+""" Dedup module
+
+Provides a streaming version of the clean action, for TSV databases that do
+not fit in memory. Rows are read once, their keys are computed, and they are
+sorted externally: sorted runs are spilled to temporary files next to the
+database, and merged back. The output is the same as the one of the in-memory
+clean action.
+"""
+
+import heapq
+import logging
+import os
+import pickle
+import tempfile
+from ina.database import InaEntry, EntryDiffusion, datetime_sort_key,\
+    confirm_reset
+from ina.tools import slugify, atomic_writer
+
+
+CHUNK_SIZE = 100000
+
+
+class ExternalSorter:
+    """Sort records that may not fit in memory, by spilling sorted runs of
+       at most chunk_size records to a directory, and merging them
+    """
+
+    def __init__(self, directory, chunk_size=CHUNK_SIZE):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.records = list()
+        self.paths = list()
+
+    def add(self, record):
+        """Add a record to sort"""
+        self.records.append(record)
+        if len(self.records) >= self.chunk_size:
+            self.spill()
+
+    def spill(self):
+        """Write the records held in memory as a sorted run"""
+        if len(self.records) == 0:
+            return
+        self.records.sort()
+        descriptor, path = tempfile.mkstemp(dir=self.directory, suffix=".run")
+        with os.fdopen(descriptor, "wb") as file:
+            for record in self.records:
+                pickle.dump(record, file, pickle.HIGHEST_PROTOCOL)
+        self.paths.append(path)
+        self.records = list()
+
+    def sorted(self):
+        """Iterate over all the records, sorted"""
+        self.spill()
+        return heapq.merge(*map(read_run, self.paths))
+
+
+def read_run(path):
+    """Iterate over the records of a run file"""
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                break
+
+
+def clean(options, chunk_size=CHUNK_SIZE):
+    """Remove duplicates and select collection title, streaming the
+       database instead of loading it
+    """
+    path = options["database"]
+    logging.info("Streaming database at %s", os.path.abspath(path))
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory) as temp_directory:
+        # Sort rows by collection and title slug, in the order they come
+        by_title = ExternalSorter(temp_directory, chunk_size)
+        slugs, titles, original_sizes = dict(), dict(), dict()
+        with open(path, "r") as file:
+            file.readline()
+            for i, line in enumerate(file):
+                entry_serial = line.strip()
+                split = entry_serial.split("\t")
+                slug = slugify(split[1])
+                if slug not in slugs:
+                    slugs[slug] = len(slugs)
+                    titles[slug] = dict()
+                    original_sizes[slug] = 0
+                titles[slug].setdefault(split[1], 0)
+                titles[slug][split[1]] += 1
+                original_sizes[slug] += 1
+                diffusion = EntryDiffusion()
+                diffusion.from_serial(split[7:11])
+                by_title.add((
+                    slugs[slug],
+                    slugify(split[0]),
+                    i,
+                    datetime_sort_key(diffusion.datetime),
+                    entry_serial
+                ))
+        # Keep the first row of each title, sorted by diffusion datetime
+        by_datetime = ExternalSorter(temp_directory, chunk_size)
+        sizes = [0] * len(slugs)
+        previous = None
+        for position, title_slug, i, key, entry_serial in by_title.sorted():
+            if (position, title_slug) == previous:
+                continue
+            previous = position, title_slug
+            sizes[position] += 1
+            by_datetime.add((position, key, i, entry_serial))
+        collection_titles = {
+            slugs[slug]: sorted(counts.items(), key=lambda x: -x[1])[0][0]
+            for slug, counts in titles.items()
+        }
+        for slug, position in slugs.items():
+            logging.info(
+                "Collection '%s' cleaned, going from %d to %d entries (-%d)",
+                slug,
+                original_sizes[slug],
+                sizes[position],
+                original_sizes[slug] - sizes[position]
+            )
+        logging.info("Saving database at %s", os.path.abspath(path))
+        if not confirm_reset(options):
+            return
+        lines, track_number, previous = 1, 0, None
+        with atomic_writer(path, "w", encoding="utf8") as file:
+            file.write(InaEntry.HEADER + "\n")
+            for position, _, _, entry_serial in by_datetime.sorted():
+                if position != previous:
+                    previous, track_number = position, 0
+                track_number += 1
+                entry = InaEntry.from_raw(entry_serial)
+                entry.category.collection_title = collection_titles[position]
+                entry.category.track_number = track_number
+                entry.category.track_total = sizes[position]
+                file.write(entry.serial() + "\n")
+                lines += 1
+    logging.info("Wrote %d lines to %s", lines, os.path.abspath(path))
@@ -4,13 +4,19 @@
 import logging
 import subprocess
 import os
+import functools
+import concurrent.futures
 import eyed3
 from ina.database import load_database
-from ina.tools import tracked_loop
+from ina.instrument import stage, timed
+from ina.scoring import rank_entries
+from ina.tools import tracked_loop, ordered_map
 
 
 def download_video_id(options, entry, video_id):
-    """Download a YouTube video, and check if it is the correct one"""
+    """Download a YouTube video, and check if it is the correct one. Return
+       the exit code of youtube-dl.
+    """
     url = "http://www.youtube.com/watch?v=" + video_id["video_id"]
     if video_id["title_error"] > options["title-error-threshold"]\
             or video_id["duration_error"] > options["duration-error-threshold"]:
@@ -23,10 +29,12 @@ def download_video_id(options, entry, video_id):
         url
     ]
     with open(os.devnull, 'w') as devnull:
-        process = subprocess.Popen(command, stdout=devnull)
-    process.wait()
+        with stage("youtube_dl"):
+            process = subprocess.Popen(command, stdout=devnull)
+            return process.wait()
 
 
+@timed("tagging")
 def set_tags(entry, video_id):
     """Set the ID3 tags of an entry"""
     filename = entry.filename() + ".mp3"
@@ -59,37 +67,77 @@ def set_tags(entry, video_id):
     return manual
 
 
+def download_entry(options, entry):
+    """Download the best media of an entry, and return the entry along with
+       the outcome, which is either "downloaded", "existing", "skipped" or
+       "failed"
+    """
+    filename = entry.filename()
+    if os.path.isfile(filename + ".mp3"):
+        logging.warning("%s already exists", entry)
+        return entry, "existing"
+    if len(entry.media.video_ids) == 0:
+        logging.error("Could not download %s", entry)
+        return entry, "skipped"
+    try:
+        returncode = download_video_id(
+            options, entry, entry.media.video_ids[0])
+    except OSError as error:
+        logging.error("Could not start youtube-dl for %s: %s", entry, error)
+        return entry, "failed"
+    if returncode != 0 or not os.path.isfile(filename + ".mp3"):
+        logging.error("youtube-dl failed for %s (exit code %d)",
+                      entry, returncode)
+        return entry, "failed"
+    return entry, "downloaded"
+
+
 def download(options):
     """Download and set tags for all videos within selected collections"""
-    database = load_database(options)
+    database = load_database(options, filtered=True)
     collection_filters = set(database)
     if len(options["filter-collections"]) > 0:
         collection_filters = options["filter-collections"]
-    for slug in collection_filters:
-        logging.info("Downloading collection %s", slug)
-        downloaded, existing, skipped = 0, 0, 0
-        for entry in tracked_loop(
+    counts = {"downloaded": 0, "existing": 0, "skipped": 0, "failed": 0}
+    downloader = concurrent.futures.ThreadPoolExecutor(
+        max_workers=options["workers"])
+    tagger = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        for slug in collection_filters:
+            logging.info("Downloading collection %s", slug)
+            rank_entries(database[slug])
+            tagging = list()
+            iterator = ordered_map(
+                downloader,
+                functools.partial(download_entry, options),
                 database[slug],
-                total=len(database[slug]),
-                titler=lambda e: "Downloading %s" % e):
-            filename = entry.filename()
-            if os.path.isfile(filename + ".mp3"):
-                logging.warning("%s already exists", entry)
-                existing += 1
-                continue
-            entry.media.video_ids.sort(
-                key=lambda d: (d["title_error"], d["duration_error"])
+                window=2 * options["workers"]
             )
-            if len(entry.media.video_ids) == 0:
-                logging.error("Could not download %s", entry)
-                skipped += 1
-                continue
-            downloaded += 1
-            download_video_id(options, entry, entry.media.video_ids[0])
-            set_tags(entry, entry.media.video_ids[0]["video_id"])
+            for entry, outcome in tracked_loop(
+                    iterator,
+                    total=len(database[slug]),
+                    titler=lambda r: "Downloaded %s (%s)" % r):
+                counts[outcome] += 1
+                if outcome == "downloaded":
+                    tagging.append((entry, tagger.submit(
+                        set_tags,
+                        entry,
+                        entry.media.video_ids[0]["video_id"]
+                    )))
+            for entry, future in tagging:
+                try:
+                    future.result()
+                except Exception as error:
+                    logging.error("Could not set tags of %s: %s", entry, error)
+                    counts["downloaded"] -= 1
+                    counts["failed"] += 1
+    finally:
+        downloader.shutdown()
+        tagger.shutdown()
     logging.info(
-        "Dowloaded %d entries and skipped %d (%d already existed)",
-        downloaded,
-        skipped,
-        existing
+        "Dowloaded %d entries and skipped %d (%d already existed, %d failed)",
+        counts["downloaded"],
+        counts["skipped"],
+        counts["existing"],
+        counts["failed"]
     )
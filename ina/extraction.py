@@ -6,17 +6,36 @@ information.
 """
 
 import logging
+import re
 import time
 import os
-import urllib.request
+import functools
+import urllib.parse
+import queue
+import threading
+import concurrent.futures
 import tqdm
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait, Select
-from ina.database import InaEntry, EntryParsingException, load_database, save_database
-from ina.tools import slugify, timed_loop, jaccard
+from ina.database import InaEntry, EntryParsingException, EntryJournal,\
+    MediaCandidate, load_database, save_database, load_keys,\
+    append_database, confirm_reset
+from ina.cache import ResponseCache
+from ina.instrument import stage, timed
+from ina.parsing import make_soup, set_parser
+from ina.fetch import FetchEngine, FetchException, CacheMissException,\
+    REDIRECT_STATUSES, MAX_REDIRECTS
+from ina.scoring import score_entries
+from ina.tools import slugify, HostRateLimiter, AdaptiveRateLimiter,\
+    ordered_map
+
+
+class ScrapingException(Exception):
+    """Custom exception for pages that cannot be scraped"""
 
 
 class Scraper:
@@ -41,11 +60,15 @@ class Scraper:
     RESULT_TABLE_ID = "result-tableau-1"
 
     def __init__(self, driver_executable_path, implicit_wait=10, delay=1.5,
-                 max_page_requests=1000):
+                 max_page_requests=1000, limiter=None):
         self.driver = None
+        self.page_count = None
         self.driver_executable_path = driver_executable_path
         self.implicit_wait = implicit_wait
         self.delay = delay
+        self.limiter = limiter
+        if self.limiter is None:
+            self.limiter = HostRateLimiter(delay)
         self.max_page_requests = max_page_requests
         logging.debug(
             "Setting driver implicit wait to %f",
@@ -60,6 +83,7 @@ class Scraper:
             self.max_page_requests
         )
 
+    @timed("driver_init")
     def initialize_driver(self):
         """Creates the selenium driver"""
         options = Options()
@@ -74,6 +98,13 @@ class Scraper:
         )
         self.driver.implicitly_wait(self.implicit_wait)
 
+    def close(self):
+        """Quit the selenium driver"""
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    @timed("page_navigation")
     def search(self, query):
         """Write the query and submit it"""
         logging.info("Driver is reaching URL %s", Scraper.SEARCH_URL)
@@ -93,45 +124,254 @@ class Scraper:
         WebDriverWait(self.driver, self.implicit_wait).until(
             EC.url_changes(current_url))
         logging.debug("Reached result page")
-
-    def get_results(self):
-        """Yield all results one by one, and only correct ones"""
-        last_request = time.time()
         results_count_div = self.driver.find_element_by_xpath(
             Scraper.XPATHS["results_count_div"])
-        result_count = int(results_count_div.text.split(" ")[-1])
-        result_per_page = int(results_count_div.text.split(" ")[3])
-        page_count = 1 + ((result_count - 1) // result_per_page)
-        logging.info(
-            "Scraper found %d results (%d per page, %d pages)",
-            result_count,
-            result_per_page,
-            page_count
-        )
-        if page_count > self.max_page_requests:
-            page_count = self.max_page_requests
-            logging.info("Forcing number of page requests to %d", page_count)
-        iterator = tqdm.tqdm(range(1, page_count + 1))
-        for i in iterator:
-            for j, result in enumerate(scrap_result_page(self.driver.page_source)):
-                if result is not None:
-                    yield result
-                else:
-                    logging.warning(
-                        "Error while extracting row %d of page %d", j + 1, i)
-            if i < page_count:
+        self.page_count = count_pages(
+            results_count_div.text, self.max_page_requests)
+
+    def iter_pages(self):
+        """Yield the HTML source of each result page, in order, clicking on
+           the next link between them as the rate limiter allows
+        """
+        for i in range(1, self.page_count + 1):
+            yield self.driver.page_source
+            if i < self.page_count:
                 next_link = self.driver.find_elements_by_xpath(
                     Scraper.XPATHS["next_link"])
                 if len(next_link) == 0:
                     logging.warning("Next link not found")
-                    iterator.close()
-                    break
+                    return
                 next_link = next_link[0]
-                time_since_last_request = time.time() - last_request
-                time_to_wait = max(0, self.delay - time_since_last_request)
-                next_link.click()
-                time.sleep(time_to_wait)
-                last_request = time.time()
+                url = self.driver.current_url
+                self.limiter.wait(url)
+                start = time.time()
+                try:
+                    with stage("page_navigation"):
+                        next_link.click()
+                except WebDriverException:
+                    self.limiter.feedback(url, time.time() - start, True)
+                    raise
+                self.limiter.feedback(url, time.time() - start)
+
+
+STRAINERS = {
+    "result_table": SoupStrainer("div", {"id": Scraper.RESULT_TABLE_ID}),
+    "credits": SoupStrainer("td", {"id": "GEN"}),
+    "media": SoupStrainer(
+        "div", {"class": re.compile(r"(^|\s)yt-lockup-video(\s|$)")}),
+}
+
+
+class HttpScraper:
+
+    """A web scraper for http://inatheque.ina.fr/ main result page, that
+       replays the search form submission and the pagination as plain HTTP
+       requests, without a browser. Result pages are fetched concurrently
+       when their URLs can be guessed from the next link.
+    """
+
+    def __init__(self, engine, workers=1, max_page_requests=1000):
+        self.engine = engine
+        self.workers = workers
+        self.max_page_requests = max_page_requests
+        self.cookies = dict()
+        self.page = None
+        self.page_count = None
+
+    def initialize_driver(self):
+        """Nothing to initialize, connections are opened when needed"""
+
+    def close(self):
+        """Nothing to close, connections belong to the engine"""
+
+    def fetch(self, url, method="GET", body=None):
+        """Fetch a page within the scraper session, following redirections
+           and keeping track of cookies
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            headers = dict()
+            if len(self.cookies) > 0:
+                headers["Cookie"] = "; ".join(
+                    "%s=%s" % item for item in sorted(self.cookies.items()))
+            if body is not None:
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            with stage("page_navigation"):
+                response = self.engine.fetch(
+                    url, method, body, headers, follow_redirects=False)
+            for cookie in response.headers.get("set-cookie", "").split("\n"):
+                name, _, value = cookie.split(";")[0].partition("=")
+                if name.strip() != "":
+                    self.cookies[name.strip()] = value.strip()
+            if response.status not in REDIRECT_STATUSES\
+                    or "location" not in response.headers:
+                return response
+            url = urllib.parse.urljoin(url, response.headers["location"])
+            method, body = "GET", None
+        raise ScrapingException("Too many redirections for %s" % url)
+
+    def search(self, query):
+        """Submit the search form with the query, and read the number of
+           result pages
+        """
+        logging.info("Scraper is reaching URL %s", Scraper.SEARCH_URL)
+        response = self.fetch(Scraper.SEARCH_URL)
+        soup = make_soup(response.text())
+        form = find_by_xpath(soup, Scraper.XPATHS["search_form"])
+        search_input = find_by_xpath(soup, Scraper.XPATHS["search_input"])
+        select = find_by_xpath(
+            soup, Scraper.XPATHS["results_per_page_select"])
+        if form is None or search_input is None or select is None:
+            raise ScrapingException("Search form not found")
+        fields = list()
+        for field in form.find_all(["input", "select", "textarea"]):
+            name = field.get("name")
+            if name is None or field.get("disabled") is not None:
+                continue
+            if field.name == "select":
+                options = field.find_all("option")
+                selected = [o for o in options if o.get("selected") is not None]
+                if field is select:
+                    selected = options[-1:]
+                value = ""
+                if len(selected + options) > 0:
+                    option = (selected + options)[0]
+                    value = option.get("value", option.get_text())
+            elif field.name == "textarea":
+                value = field.get_text()
+            elif field.get("type", "text").lower() in ["checkbox", "radio"]:
+                if field.get("checked") is None:
+                    continue
+                value = field.get("value", "on")
+            elif field.get("type", "text").lower() in [
+                    "submit", "button", "image", "reset", "file"]:
+                continue
+            else:
+                value = field.get("value", "")
+            if field is search_input:
+                value = query
+            fields.append((name, value))
+        logging.info("Input query is '%s'", query)
+        action = urllib.parse.urljoin(response.url, form.get("action", ""))
+        data = urllib.parse.urlencode(fields)
+        logging.debug("Submitting search form to %s", action)
+        if form.get("method", "get").lower() == "post":
+            response = self.fetch(action, "POST", data.encode("utf8"))
+        else:
+            response = self.fetch(action.split("?")[0] + "?" + data)
+        self.page = response
+        soup = make_soup(response.text())
+        results_count_div = find_by_xpath(
+            soup, Scraper.XPATHS["results_count_div"])
+        if results_count_div is None:
+            raise ScrapingException("Results count not found")
+        self.page_count = count_pages(
+            results_count_div.get_text().strip(), self.max_page_requests)
+
+    def iter_pages(self):
+        """Yield the HTML source of each result page, in order. Pages are
+           reached through the next links, until the URL of a page matches
+           the one guessed from the previous page: the remaining pages are
+           then fetched concurrently.
+        """
+        html = self.page.text()
+        yield html
+        url = self.page.url
+        guessed_urls = None
+        for i in range(2, self.page_count + 1):
+            next_link = find_by_xpath(
+                make_soup(html), Scraper.XPATHS["next_link"])
+            if next_link is None or next_link.get("href") is None:
+                logging.warning("Next link not found")
+                return
+            url = urllib.parse.urljoin(url, next_link["href"])
+            page_urls = guess_page_urls(url, i, self.page_count)
+            if page_urls is not None and guessed_urls is not None\
+                    and page_urls[0] == guessed_urls[0]:
+                break
+            guessed_urls = None if page_urls is None else page_urls[1:]
+            html = self.fetch(url).text()
+            yield html
+        else:
+            return
+        logging.debug("Fetching result pages %d to %d concurrently",
+                      i, self.page_count)
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers)
+        try:
+            for html in ordered_map(
+                    executor,
+                    lambda url: self.fetch(url).text(),
+                    page_urls,
+                    window=2 * self.workers):
+                yield html
+        finally:
+            executor.shutdown()
+
+
+def find_by_xpath(soup, xpath):
+    """Return the element at an absolute XPath such as /html/body/div[2],
+       or None if it does not exist. Missing tbody elements, which browsers
+       add to tables on their own, are skipped.
+    """
+    element = soup
+    for step in xpath.strip("/").split("/"):
+        name, _, index = step.partition("[")
+        index = int(index.rstrip("]")) if index != "" else 1
+        children = element.find_all(name, recursive=False)
+        if len(children) == 0 and name == "tbody":
+            continue
+        if len(children) < index:
+            return None
+        element = children[index - 1]
+    return element
+
+
+def count_pages(results_count_text, max_page_requests):
+    """Return the number of result pages to request, from the text of the
+       results count div
+    """
+    result_count = int(results_count_text.split(" ")[-1])
+    result_per_page = int(results_count_text.split(" ")[3])
+    page_count = 1 + ((result_count - 1) // result_per_page)
+    logging.info(
+        "Scraper found %d results (%d per page, %d pages)",
+        result_count,
+        result_per_page,
+        page_count
+    )
+    if page_count > max_page_requests:
+        page_count = max_page_requests
+        logging.info("Forcing number of page requests to %d", page_count)
+    return page_count
+
+
+def guess_page_urls(url, page, page_count):
+    """Given the URL of a result page, return the URLs of this page and of
+       the following ones up to page_count, if a query parameter holds the
+       page number. Return None otherwise.
+    """
+    split = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(split.query, keep_blank_values=True)
+    for k, (_, value) in enumerate(query):
+        if value != str(page):
+            continue
+        urls = list()
+        for i in range(page, page_count + 1):
+            query[k] = (query[k][0], str(i))
+            urls.append(urllib.parse.urlunsplit(
+                split._replace(query=urllib.parse.urlencode(query))))
+        return urls
+    return None
+
+
+def iter_page_results(html, page):
+    """Yield the correct results of a result page"""
+    for j, result in enumerate(scrap_result_page(html)):
+        if result is not None:
+            yield result
+        else:
+            logging.warning(
+                "Error while extracting row %d of page %d", j + 1, page)
 
 
 def scrap_result_page(html):
@@ -139,7 +379,7 @@ def scrap_result_page(html):
        results as they are found. If an error occurs during the extraction,
        then a None is yielded.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = make_soup(html, only=STRAINERS["result_table"])
     table_div = soup.find("div", {"id": Scraper.RESULT_TABLE_ID})
     header_row = True
     for row in table_div.find_all("tr"):
@@ -155,11 +395,12 @@ def scrap_result_page(html):
             yield None
 
 
-def enrich_credits(entry):
+def enrich_credits(entry, engine):
     """Enrich the credits information of an entry"""
     if entry.credits.link is not None:
-        html = urllib.request.urlopen(entry.credits.link).read().decode()
-        soup = BeautifulSoup(html, "html.parser")
+        with stage("credits_fetch"):
+            html = engine.fetch(entry.credits.link).text()
+        soup = make_soup(html, only=STRAINERS["credits"])
         element = soup.find("td", {"id": "GEN"})
         if element is not None:
             text = element.get_text().strip().replace("\t", "")
@@ -167,15 +408,15 @@ def enrich_credits(entry):
             entry.credits.extract_text()
 
 
-def enrich_media(entry):
+def enrich_media(entry, engine):
     """Enrich media"""
     query_string = urllib.parse.urlencode(
         {"search_query": "%s %s" % (entry.title, entry.category.collection)}
     )
-    html = urllib.request.urlopen(
-        "http://www.youtube.com/results?" + query_string
-    ).read().decode()
-    soup = BeautifulSoup(html, "html.parser")
+    with stage("media_fetch"):
+        html = engine.fetch(
+            "http://www.youtube.com/results?" + query_string).text()
+    soup = make_soup(html, only=STRAINERS["media"])
     search_results = list()
     for div in soup.find_all("div", {"class": "yt-lockup-video"}):
         duration_txt = div.find("span", {"class": "video-time"})\
@@ -185,85 +426,294 @@ def enrich_media(entry):
         duration = 0
         for base, factor in zip([3600, 60, 1], duration_txt.split(":")):
             duration += base * int(factor)
-        search_result = {
-            "duration": duration,
-            "title":
-                div.find("h3", {"class": "yt-lockup-title"})
+        search_results.append(MediaCandidate(
+            duration=duration,
+            title=div.find("h3", {"class": "yt-lockup-title"})
             .find("a").get_text().strip(),
-            "video_id":
-                div.find("h3", {"class": "yt-lockup-title"})
+            video_id=div.find("h3", {"class": "yt-lockup-title"})
             .find("a")["href"][-11:],
-        }
-        if entry.attributes.duration == 0:
-            search_result["duration_error"] = 1
-        else:
-            search_result["duration_error"] =\
-                abs(search_result["duration"] -
-                    entry.attributes.duration)\
-                / entry.attributes.duration
-        search_result["title_error"] =\
-            1 - jaccard(
-                entry.category.collection + " " + entry.title,
-                search_result["title"]
-            )
-        search_results.append(search_result)
+        ))
     entry.media.video_ids = search_results[:]
+    score_entries([entry])
 
 
-def scrap(options):
-    """Scrap initial data from https://inatheque.ina.fr/"""
-    if options["append"]:
-        database = open(options["database"], "a")
-    else:
-        if not options["skip-confirmation"]\
-                and os.path.isfile(options["database"]):
-            validation = input(
-                "This action will reset the database at %s, continue? (y/n) "
-                % os.path.abspath(options["database"])
+class ScrapSession:
+
+    """Scraper reused across the queries of a batch, so that it is only
+       initialized once. The HTTP scraper is used if asked, and replaced for
+       good by a Selenium one if a search fails.
+    """
+
+    def __init__(self, options, limiter, engine=None):
+        self.options = options
+        self.limiter = limiter
+        self.scraper = None
+        if engine is not None:
+            self.scraper = HttpScraper(
+                engine,
+                workers=options["workers"],
+                max_page_requests=options["max-page-requests"]
             )
-            if validation.lower() != "y":
-                return
-        database = open(options["database"], "w")
-        database.write(InaEntry.HEADER + "\n")
-    scraper = Scraper(
-        options["driver-executable-path"],
-        delay=options["delay"],
-        max_page_requests=options["max-page-requests"]
+
+    def search(self, query):
+        """Submit a query, and return the scraper holding its results"""
+        if isinstance(self.scraper, HttpScraper):
+            try:
+                self.scraper.search(query)
+                return self.scraper
+            except (ScrapingException, FetchException) as error:
+                logging.warning(
+                    "HTTP scraping failed (%s), using selenium", error)
+            self.scraper = None
+        if self.scraper is None:
+            self.scraper = Scraper(
+                self.options["driver-executable-path"],
+                delay=self.options["delay"],
+                max_page_requests=self.options["max-page-requests"],
+                limiter=self.limiter
+            )
+            self.scraper.initialize_driver()
+        self.scraper.search(query)
+        return self.scraper
+
+    def close(self):
+        """Close the scraper"""
+        if self.scraper is not None:
+            self.scraper.close()
+
+
+class ResultWriter:
+
+    """Append scraped results to the database, in its storage format, from
+       one or several threads. If a set of known keys is given, results
+       already in the database are skipped.
+    """
+
+    def __init__(self, options, known=None):
+        self.options = options
+        self.known = known
+        self.lock = threading.Lock()
+        self.added = 0
+        self.ignored = 0
+        self.skipped = 0
+
+    def ignore(self):
+        """Count a result from a filtered out collection"""
+        with self.lock:
+            self.ignored += 1
+
+    def write(self, results):
+        """Write the results of a page, and return the number of the new
+           ones and of the known ones
+        """
+        with self.lock:
+            new = list()
+            for result in results:
+                if self.known is not None:
+                    if result.key() in self.known:
+                        continue
+                    self.known.add(result.key())
+                new.append(result)
+            if len(new) > 0:
+                append_database(self.options, new)
+            self.added += len(new)
+            self.skipped += len(results) - len(new)
+            return len(new), len(results) - len(new)
+
+
+def make_limiter(options):
+    """Return the rate limiter for the requests of an action"""
+    return AdaptiveRateLimiter(
+        options["delay"],
+        options["min-delay"],
+        options["max-delay"]
     )
-    scraper.initialize_driver()
-    scraper.search(options["query"])
-    added, ignored = 0, 0
-    for result in scraper.get_results():
-        if slugify(result.category.collection) not in options["filter-collections"]:
-            ignored += 1
-            continue
-        added += 1
-        result.diffusion.extract_datetime()
-        result.attributes.extract_duration()
-        database.write(result.serial() + "\n")
-    database.close()
+
+
+def read_queries(options):
+    """Return the queries to scrap: the query option, and the lines of the
+       query file if there is one
+    """
+    if options["query-file"] == "":
+        return [options["query"]]
+    queries = list()
+    if options["query"] != "":
+        queries.append(options["query"])
+    with open(options["query-file"], "r") as file:
+        for line in file:
+            if line.strip() != "":
+                queries.append(line.strip())
+    logging.info("Read %d queries from %s", len(queries),
+                 os.path.abspath(options["query-file"]))
+    return queries
+
+
+def scrap_query(options, session, query, writer):
+    """Scrap the results of one query into the database"""
+    scraper = session.search(query)
+    pages = scraper.iter_pages()
+    progress = tqdm.tqdm(pages, total=scraper.page_count)
+    for i, html in enumerate(progress):
+        results = list()
+        for result in iter_page_results(html, i + 1):
+            if slugify(result.category.collection) not in options["filter-collections"]:
+                writer.ignore()
+                continue
+            result.diffusion.extract_datetime()
+            result.attributes.extract_duration()
+            results.append(result)
+        page_added, page_skipped = writer.write(results)
+        if page_skipped > 0 and page_added == 0:
+            logging.info("Page %d of query '%s' only holds known entries, "
+                         "stopping", i + 1, query)
+            break
+    progress.close()
+    pages.close()
+
+
+def scrap(options):
+    """Scrap initial data from https://inatheque.ina.fr/"""
+    set_parser(options["html-parser"])
+    queries = read_queries(options)
+    known = None
+    if options["incremental"]:
+        known = load_keys(options, filtered=True)
+    elif not options["append"]:
+        if not confirm_reset(options):
+            return
+        if os.path.isfile(options["database"]):
+            os.remove(options["database"])
+    append_database(options, list())
+    limiter = make_limiter(options)
+    engine = None
+    if options["scraper"] == "http":
+        engine = FetchEngine(
+            timeout=options["timeout"],
+            retries=options["retries"],
+            max_connections=options["workers"],
+            limiter=limiter,
+            resolve=options["resolve"]
+        )
+    writer = ResultWriter(options, known)
+    sessions = queue.Queue()
+    n_sessions = max(1, min(options["workers"], len(queries)))
+    for _ in range(n_sessions):
+        sessions.put(ScrapSession(options, limiter, engine))
+
+    def run(query):
+        session = sessions.get()
+        try:
+            scrap_query(options, session, query, writer)
+        except (ScrapingException, FetchException, WebDriverException)\
+                as error:
+            logging.error("Could not scrap query '%s': %s", query, error)
+        finally:
+            sessions.put(session)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_sessions)
+    try:
+        for _ in executor.map(run, queries):
+            pass
+    finally:
+        executor.shutdown()
+        while not sessions.empty():
+            sessions.get().close()
+        if engine is not None:
+            engine.close()
     logging.info(
-        "Database contains %d entries (%d have been ignored)",
-        added,
-        ignored
+        "Database contains %d new entries (%d have been ignored, %d were "
+        "already known)",
+        writer.added,
+        writer.ignored,
+        writer.skipped
     )
 
 
+def enrich_entry(options, engine, entry):
+    """Enrich the credits and media information of an entry, as needed.
+       Return None if a page is missing from the cache in offline mode.
+    """
+    try:
+        if not options["append"]\
+                or entry.credits.author is None\
+                or entry.credits.director is None:
+            enrich_credits(entry, engine)
+        if not options["append"] or len(entry.media.video_ids) == 0:
+            enrich_media(entry, engine)
+    except CacheMissException as error:
+        logging.warning("Could not enrich %s: %s", entry, error)
+        return None
+    return entry
+
+
 def enrich(options):
     """Enrich the credits and media information of the selected entries"""
-    database = load_database(options)
+    set_parser(options["html-parser"])
+    database = load_database(options, filtered=True)
     collection_filters = set(database)
     if len(options["filter-collections"]) > 0:
         collection_filters = options["filter-collections"]
-    for slug in collection_filters:
-        logging.info("Enriching collection %s", slug)
-        iterator = timed_loop(
-            tqdm.tqdm(database[slug]), delay=options["delay"])
-        for entry in iterator:
-            if not options["append"]\
-                    or entry.credits.author is None\
-                    or entry.credits.director is None:
-                enrich_credits(entry)
-            if not options["append"] or len(entry.media.video_ids) == 0:
-                enrich_media(entry)
-    save_database(options, database)
+    journal = EntryJournal(
+        options["database"] + ".journal",
+        checkpoint_interval=options["checkpoint-interval"]
+    )
+    journaled = dict()
+    if options["resume"]:
+        journaled = journal.read()
+        logging.info("Resuming with %d entries from journal %s",
+                     len(journaled), os.path.abspath(journal.path))
+    journal.open(resume=options["resume"])
+    cache = None
+    if options["cache-directory"] != "":
+        cache = ResponseCache(
+            options["cache-directory"],
+            ttl=options["cache-ttl"],
+            max_size=options["cache-size"] * 1000000
+        )
+    engine = FetchEngine(
+        timeout=options["timeout"],
+        retries=options["retries"],
+        max_connections=options["workers"],
+        pipeline_depth=options["pipeline-depth"],
+        limiter=make_limiter(options),
+        resolve=options["resolve"],
+        cache=cache,
+        offline=options["offline"]
+    )
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=options["workers"])
+    logging.info("Enriching with %d workers", options["workers"])
+    try:
+        for slug in collection_filters:
+            entries = list()
+            for i, entry in enumerate(database[slug]):
+                if entry.key() in journaled:
+                    database[slug][i] = journaled[entry.key()]
+                else:
+                    entries.append(entry)
+            logging.info(
+                "Enriching collection %s (%d entries already enriched)",
+                slug,
+                len(database[slug]) - len(entries)
+            )
+            iterator = ordered_map(
+                executor,
+                functools.partial(enrich_entry, options, engine),
+                entries,
+                window=2 * options["workers"]
+            )
+            for entry in tqdm.tqdm(iterator, total=len(entries)):
+                if entry is not None:
+                    journal.append(entry)
+    except KeyboardInterrupt:
+        logging.warning(
+            "Interrupted, use the resume option to continue from journal %s",
+            os.path.abspath(journal.path)
+        )
+        raise
+    finally:
+        executor.shutdown()
+        engine.close()
+        journal.close()
+    if save_database(options, database, partial=True):
+        journal.remove()
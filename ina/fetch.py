@@ -0,0 +1,431 @@
+""" Fetch module
+
+Provides an asyncio HTTP/1.1 client that keeps connections alive, pools them
+per host, and can pipeline requests over them. The event loop runs in a
+background thread, so that synchronous code such as the enrichment workers
+can share a single engine.
+"""
+
+import asyncio
+import collections
+import logging
+import ssl
+import threading
+import time
+import urllib.parse
+import zlib
+from ina.instrument import count
+
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+
+MAX_REDIRECTS = 5
+
+MAX_IDLE = 4.
+
+
+class FetchException(Exception):
+    """Custom exception for failed requests"""
+
+
+class CacheMissException(FetchException):
+    """Custom exception for requests that are not cached, in offline mode"""
+
+
+class ConnectionClosedException(FetchException):
+    """Custom exception for connections closed before a response starts"""
+
+
+class StaleConnectionException(FetchException):
+    """Custom exception for requests sent over a kept-alive connection that
+       the server had closed, which can be sent again right away
+    """
+
+
+class Response:
+    """HTTP response"""
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def __str__(self):
+        return "<Response; url: \"%s\"; status: %d>" % (self.url, self.status)
+
+    def text(self):
+        """Return the body decoded with the charset of the response"""
+        charset = "utf-8"
+        for parameter in self.headers.get("content-type", "").split(";")[1:]:
+            name, _, value = parameter.strip().partition("=")
+            if name.lower() == "charset" and value != "":
+                charset = value.strip("\"")
+        return self.body.decode(charset, errors="replace")
+
+
+async def read_response(reader, method):
+    """Read an HTTP response from a stream, and return its status, its
+       headers and its body, along with whether the connection can be kept
+       alive
+    """
+    try:
+        status_line = await reader.readline()
+    except OSError as error:
+        raise ConnectionClosedException(str(error))
+    if status_line == b"":
+        raise ConnectionClosedException("Connection closed by peer")
+    split = status_line.decode("latin-1").split(" ", 2)
+    if len(split) < 2 or not split[0].startswith("HTTP/"):
+        raise FetchException("Malformed status line %r" % status_line)
+    version, status = split[0], int(split[1])
+    headers = dict()
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if line == "":
+            break
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name in headers:
+            value = headers[name] + ("\n" if name == "set-cookie" else ", ")\
+                + value.strip()
+        headers[name] = value.strip()
+    keep_alive = version != "HTTP/1.0"\
+        and headers.get("connection", "").lower() != "close"
+    if method == "HEAD" or status in [204, 304] or 100 <= status < 200:
+        body = b""
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = list()
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await reader.readline()).strip() != b"":
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    if headers.get("content-encoding", "").lower() == "gzip":
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    return status, headers, body, keep_alive
+
+
+class Connection:
+    """Persistent connection to a host. Requests are written as soon as they
+       are sent, and responses are read back in order, which allows
+       pipelining.
+    """
+
+    def __init__(self, loop, host, port, ssl_context=None):
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.reader = None
+        self.writer = None
+        self.ready = loop.create_future()
+        self.pending = collections.deque()
+        self.load = 0
+        self.reading = False
+        self.closed = False
+        self.responses = 0
+        self.last_used = time.monotonic()
+
+    async def connect(self):
+        """Open the connection, and resolve the ready future"""
+        logging.debug("Opening connection to %s:%d", self.host, self.port)
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.ssl_context)
+        except OSError as error:
+            self.closed = True
+            self.ready.set_exception(error)
+        else:
+            self.ready.set_result(True)
+
+    def send(self, request, method):
+        """Write a request, and return a future for its response"""
+        future = self.loop.create_future()
+        self.pending.append((future, method))
+        self.writer.write(request)
+        if not self.reading:
+            self.reading = True
+            self.loop.create_task(self._read_responses())
+        return future
+
+    async def _read_responses(self):
+        try:
+            while len(self.pending) > 0 and not self.closed:
+                future, method = self.pending[0]
+                status, headers, body, keep_alive = await read_response(
+                    self.reader, method)
+                self.pending.popleft()
+                self.responses += 1
+                self.last_used = time.monotonic()
+                if not future.done():
+                    future.set_result((status, headers, body))
+                if not keep_alive:
+                    self.close()
+        except ConnectionClosedException as error:
+            # A kept-alive connection may have been closed by the server
+            # while idle, before any response to the pending requests
+            self.close(error, stale=self.responses > 0)
+        except (OSError, EOFError, ValueError, FetchException) as error:
+            self.close(error)
+        finally:
+            self.reading = False
+
+    def is_idle(self, max_idle):
+        """Return whether the connection has had nothing to do for longer
+           than max_idle seconds, and may have been closed by the server
+        """
+        return self.load == 0 and self.responses > 0\
+            and time.monotonic() - self.last_used > max_idle
+
+    def close(self, error=None, stale=False):
+        """Close the connection, failing all the requests still pending. If
+           stale, they fail with a StaleConnectionException.
+        """
+        self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+        exception_class = StaleConnectionException if stale\
+            else FetchException
+        while len(self.pending) > 0:
+            future, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(
+                    exception_class(error or "Connection closed"))
+
+
+class HostPool:
+    """Pool of persistent connections to a single host"""
+
+    def __init__(self, loop, scheme, host, port, max_connections,
+                 pipeline_depth, max_idle=MAX_IDLE):
+        self.loop = loop
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.pipeline_depth = pipeline_depth
+        self.max_idle = max_idle
+        self.connections = list()
+        self.semaphore = asyncio.Semaphore(max_connections * pipeline_depth)
+
+    def acquire(self):
+        """Return a connection that can accept one more request, opening a
+           new one if all the current connections are busy. Connections idle
+           for too long are closed rather than reused.
+        """
+        for connection in self.connections:
+            if connection.is_idle(self.max_idle):
+                connection.close()
+        self.connections = [c for c in self.connections if not c.closed]
+        available = [c for c in self.connections
+                     if c.load < self.pipeline_depth]
+        connection = None
+        if len(available) > 0:
+            connection = min(available, key=lambda c: c.load)
+            if connection.load > 0\
+                    and len(self.connections) < self.max_connections:
+                connection = None
+        if connection is None:
+            ssl_context = None
+            if self.scheme == "https":
+                ssl_context = ssl.create_default_context()
+            connection = Connection(
+                self.loop, self.host, self.port, ssl_context)
+            self.loop.create_task(connection.connect())
+            self.connections.append(connection)
+        connection.load += 1
+        return connection
+
+    def close(self):
+        """Close all the connections of the pool"""
+        for connection in self.connections:
+            connection.close()
+        self.connections = list()
+
+
+class FetchEngine:
+    """HTTP client with connection reuse, timeouts and retries with
+       exponential backoff. A rate limiter may be given to pace the requests
+       per host, which is told the latency of each response and whether it
+       failed. The resolve dictionary maps host names to the base URL of
+       the server to actually connect to (e.g. a local stand-in server).
+       Successful GET responses are stored in the cache if one is given, and
+       in offline mode, responses are only served from that cache, expired
+       ones included. Requests
+       sent over a kept-alive connection that the server has closed are sent
+       again right away on a new one, and do not count as failures.
+    """
+
+    def __init__(self, timeout=30, retries=3, backoff=1., max_connections=2,
+                 pipeline_depth=1, limiter=None, resolve=None, cache=None,
+                 offline=False):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.pipeline_depth = pipeline_depth
+        self.limiter = limiter
+        self.resolve = dict() if resolve is None else resolve
+        self.cache = cache
+        self.offline = offline
+        self.pools = dict()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fetch(self, url, method="GET", body=None, headers=None,
+              follow_redirects=True):
+        """Fetch a URL, blocking the calling thread until the response is
+           received. Raise a FetchException if the response is an error.
+        """
+        cacheable = self.cache is not None and method == "GET"
+        if cacheable:
+            response = self.cache.get(url, ignore_ttl=self.offline)
+            if response is not None:
+                count("cache_hits")
+                return response
+            count("cache_misses")
+        if self.offline:
+            raise CacheMissException("%s is not cached" % url)
+        if self.limiter is not None:
+            self.limiter.wait(url)
+        count("requests")
+        response = asyncio.run_coroutine_threadsafe(
+            self.request(url, method, body, headers, follow_redirects),
+            self.loop
+        ).result()
+        if response.status >= 400:
+            raise FetchException(
+                "Got status %d for %s" % (response.status, url))
+        if cacheable:
+            self.cache.put(url, response)
+        return response
+
+    def get_pool(self, url):
+        """Return the connection pool for the host of a URL"""
+        netloc = urllib.parse.urlsplit(url).netloc
+        target = urllib.parse.urlsplit(self.resolve.get(netloc, url))
+        key = (target.scheme, target.netloc)
+        if key not in self.pools:
+            port = target.port
+            if port is None:
+                port = 443 if target.scheme == "https" else 80
+            self.pools[key] = HostPool(
+                self.loop,
+                target.scheme,
+                target.hostname,
+                port,
+                self.max_connections,
+                self.pipeline_depth
+            )
+        return self.pools[key]
+
+    async def send(self, url, method, body, headers):
+        """Send a single request, and wait for its response"""
+        split = urllib.parse.urlsplit(url)
+        path = split.path or "/"
+        if split.query:
+            path += "?" + split.query
+        request_headers = {
+            "Host": split.netloc,
+            "User-Agent": "InaRipper",
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        }
+        if body is not None:
+            request_headers["Content-Length"] = str(len(body))
+        request_headers.update(headers or dict())
+        request = "%s %s HTTP/1.1\r\n%s\r\n\r\n" % (
+            method,
+            path,
+            "\r\n".join("%s: %s" % item for item in request_headers.items())
+        )
+        request = request.encode("latin-1") + (body or b"")
+        pool = self.get_pool(url)
+        async with pool.semaphore:
+            connection = pool.acquire()
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(connection.ready), self.timeout)
+                future = connection.send(request, method)
+                status, response_headers, response_body = await asyncio.wait_for(
+                    future, self.timeout)
+            except asyncio.TimeoutError:
+                connection.close("Timeout")
+                raise
+            finally:
+                connection.load -= 1
+        return Response(url, status, response_headers, response_body)
+
+    async def request(self, url, method="GET", body=None, headers=None,
+                      follow_redirects=True):
+        """Send a request, following redirections if asked, and retrying
+           with exponential backoff on network errors and on server errors
+        """
+        redirects = 0
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.send(url, method, body, headers)
+            except StaleConnectionException as error:
+                # Not a failure of the server: send again on a new connection
+                logging.debug("Resending %s after stale connection: %s",
+                              url, error)
+                count("stale_connections")
+                continue
+            except (OSError, asyncio.TimeoutError, FetchException) as error:
+                self.feedback(url, start, True)
+                if attempt >= self.retries:
+                    raise FetchException(
+                        "Could not fetch %s: %s" % (url, error))
+                logging.debug("Retrying %s after error: %s", url, error)
+            else:
+                self.feedback(url, start, response.status in RETRY_STATUSES)
+                if follow_redirects\
+                        and response.status in REDIRECT_STATUSES\
+                        and "location" in response.headers\
+                        and redirects < MAX_REDIRECTS:
+                    redirects += 1
+                    url = urllib.parse.urljoin(
+                        url, response.headers["location"])
+                    if response.status in [301, 302, 303]\
+                            and method != "HEAD":
+                        method, body = "GET", None
+                    continue
+                if response.status not in RETRY_STATUSES\
+                        or attempt >= self.retries:
+                    return response
+                logging.debug("Retrying %s after status %d",
+                              url, response.status)
+            count("retries")
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def feedback(self, url, start, error):
+        """Tell the rate limiter how a request went"""
+        if self.limiter is not None:
+            self.limiter.feedback(url, time.perf_counter() - start, error)
+
+    def close(self):
+        """Close all connections and stop the event loop"""
+        def stop():
+            for pool in self.pools.values():
+                pool.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,202 @@
+""" Index module
+
+Provides a sidecar index for TSV databases, giving random access to their
+rows. The index is an SQLite file next to the database, mapping collection
+slugs, entry keys (see InaEntry.key) and filenames to the byte offsets of the
+rows. The database is memory-mapped, and only the rows asked for are decoded.
+The index records the size and the modification time of the database it was
+built from, and is built again whenever they change.
+"""
+
+import logging
+import mmap
+import os
+import sqlite3
+from ina.database import InaEntry, file_source
+from ina.tools import slugify
+
+
+INDEX_SUFFIX = ".index"
+
+SCHEMA = [
+    "CREATE TABLE metadata (size INTEGER, mtime INTEGER)",
+    "CREATE TABLE rows (id INTEGER PRIMARY KEY, collection_slug TEXT, "
+    "title_slug TEXT, diffusion_datetime TEXT, filename TEXT, "
+    "offset INTEGER, length INTEGER)",
+    "CREATE INDEX rows_collection_slug ON rows (collection_slug)",
+    "CREATE INDEX rows_key ON rows "
+    "(collection_slug, title_slug, diffusion_datetime)",
+    "CREATE INDEX rows_filename ON rows (filename)",
+]
+
+
+def index_path(path):
+    """Return the path of the index of a database"""
+    return path + INDEX_SUFFIX
+
+
+def file_signature(path):
+    """Return the size and the modification time of a file"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def row_filename(split):
+    """Return the filename of the entry of a row, or None if its track
+       numbers are not set
+    """
+    entry = InaEntry()
+    entry.title = split[0]
+    entry.category.from_serial(split[1:7])
+    try:
+        return entry.filename()
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_rows(path):
+    """Yield the index rows of a TSV database, with the byte offset and
+       length of each line
+    """
+    with open(path, "rb") as file:
+        offset = len(file.readline())
+        for line in file:
+            split = line.decode("utf8").rstrip("\n").split("\t")
+            yield (
+                slugify(split[1]),
+                slugify(split[0]),
+                split[9],
+                row_filename(split),
+                offset,
+                len(line)
+            )
+            offset += len(line)
+
+
+def build_index(path):
+    """Build the index of a TSV database, replacing the existing one"""
+    target = index_path(path)
+    temporary = target + ".tmp"
+    if os.path.isfile(temporary):
+        os.remove(temporary)
+    signature = file_signature(path)
+    connection = sqlite3.connect(temporary)
+    try:
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.execute("INSERT INTO metadata VALUES (?, ?)", signature)
+            connection.executemany(
+                "INSERT INTO rows (collection_slug, title_slug, "
+                "diffusion_datetime, filename, offset, length) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                iter_rows(path)
+            )
+            n_rows = connection.execute(
+                "SELECT COUNT(*) FROM rows").fetchone()[0]
+    finally:
+        connection.close()
+    os.replace(temporary, target)
+    logging.info("Indexed %d rows of %s", n_rows, os.path.abspath(path))
+
+
+def is_fresh(path):
+    """Return whether the index of a database exists and matches it"""
+    if not os.path.isfile(index_path(path)):
+        return False
+    connection = sqlite3.connect(index_path(path))
+    try:
+        signature = connection.execute(
+            "SELECT size, mtime FROM metadata").fetchone()
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        connection.close()
+    return signature is not None and tuple(signature) == file_signature(path)
+
+
+def collection_ranges(path, slugs):
+    """Return the byte ranges of the rows of the given collection slugs, as
+       (offset, length) tuples in file order, if the index of the database
+       is up to date, and None otherwise
+    """
+    if not is_fresh(path):
+        return None
+    connection = sqlite3.connect(index_path(path))
+    try:
+        return {
+            slug: connection.execute(
+                "SELECT offset, length FROM rows WHERE collection_slug = ? "
+                "ORDER BY id", (slug,)).fetchall()
+            for slug in slugs
+        }
+    finally:
+        connection.close()
+
+
+class TsvIndex:
+    """Random access to the rows of a TSV database through its index, which
+       is built again first if it is missing or outdated
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not is_fresh(path):
+            build_index(path)
+        self.connection = sqlite3.connect(index_path(path))
+        self.file = open(path, "rb")
+        self.source = file_source(path, os.fstat(self.file.fileno()))
+        self.map = None
+        if file_signature(path)[0] > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the index and the mapped database"""
+        self.connection.close()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def entry(self, offset, length):
+        """Decode the entry of the row at an offset"""
+        return InaEntry.from_raw(
+            self.map[offset:offset + length].decode("utf8").rstrip("\n"),
+            source=self.source, offset=offset)
+
+    def entries(self, query, parameters):
+        """Decode the entries of the rows selected by a query, in the order
+           of the database
+        """
+        return [
+            self.entry(offset, length)
+            for offset, length in self.connection.execute(
+                "SELECT offset, length FROM rows WHERE %s ORDER BY id"
+                % query,
+                parameters
+            )
+        ]
+
+    def collection(self, slug):
+        """Return the entries of a collection"""
+        return self.entries("collection_slug = ?", (slug,))
+
+    def get(self, key):
+        """Return the entry with a key (see InaEntry.key), or None"""
+        entries = self.entries(
+            "collection_slug = ? AND title_slug = ? AND diffusion_datetime = ?",
+            key
+        )
+        if len(entries) == 0:
+            return None
+        return entries[0]
+
+    def find(self, filename):
+        """Return the entries with a filename (see InaEntry.filename)"""
+        return self.entries("filename = ?", (filename,))
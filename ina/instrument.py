@@ -0,0 +1,127 @@
+""" Instrumentation module
+
+Provides a recorder for the time spent in the main stages of the actions, and
+for counters such as cache hits or retries. Stages may be recorded from
+several threads, so the total time of a stage can exceed the wall time of the
+action. The records can be written as JSON lines at the end of an action.
+"""
+
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Recorder:
+    """Thread-safe recorder of stage timings and counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = dict()
+        self.counters = dict()
+
+    def reset(self):
+        """Forget all the records"""
+        with self.lock:
+            self.stages = dict()
+            self.counters = dict()
+
+    def add(self, name, duration):
+        """Record one occurrence of a stage, with its duration in seconds"""
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = {"count": 0, "total": 0., "min": duration,
+                         "max": duration}
+                self.stages[name] = stage
+            stage["count"] += 1
+            stage["total"] += duration
+            stage["min"] = min(stage["min"], duration)
+            stage["max"] = max(stage["max"], duration)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def records(self):
+        """Return the stages and the counters as a list of dictionaries"""
+        records = list()
+        with self.lock:
+            for name, stage in sorted(self.stages.items()):
+                record = {"type": "stage", "name": name}
+                record.update(stage)
+                record["mean"] = stage["total"] / stage["count"]
+                records.append(record)
+            for name, value in sorted(self.counters.items()):
+                records.append({"type": "counter", "name": name,
+                                "value": value})
+        return records
+
+    def write(self, path, **context):
+        """Append the records to a JSON lines file, each record holding the
+           given context
+        """
+        records = self.records()
+        with open(path, "a") as file:
+            for record in records:
+                line = dict(context)
+                line.update(record)
+                file.write(json.dumps(line) + "\n")
+        logging.info("Wrote %d records to %s", len(records),
+                     os.path.abspath(path))
+
+
+RECORDER = Recorder()
+
+
+def stage(name):
+    """Context manager timing a stage with the global recorder"""
+    return RECORDER.stage(name)
+
+
+def count(name, value=1):
+    """Increment a counter of the global recorder"""
+    RECORDER.count(name, value)
+
+
+def timed(name):
+    """Decorator timing each call of a function as a stage"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with RECORDER.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrumented(name, action):
+    """Wrap an action so that its records are written at the end of it, to
+       the path of the report option if set
+    """
+    @functools.wraps(action)
+    def wrapper(options):
+        RECORDER.reset()
+        started = datetime.datetime.now().isoformat()
+        try:
+            with stage("action"):
+                action(options)
+        finally:
+            if options["report"] != "":
+                RECORDER.write(options["report"], action=name,
+                               started=started)
+    return wrapper
@@ -0,0 +1,214 @@
+""" JSON lines module
+
+Provides a typed storage backend for the entry database. Each entry is stored
+as a JSON array of its parsed values: datetimes as epoch seconds, track
+numbers and durations as integers, author and director as they were
+extracted, media candidates as arrays. Loading an entry thus re-derives
+nothing, unlike the TSV format. The first line is a header naming the fields.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sys
+from ina.database import InaEntry, MediaCandidate
+from ina.tools import slugify, atomic_writer
+
+
+MAGIC = "ina-entries"
+
+VERSION = 1
+
+FIELDS = [
+    "collection_slug",
+    "title",
+    "collection",
+    "collection_title",
+    "track_number",
+    "track_total",
+    "program",
+    "genre",
+    "diffusion_date",
+    "diffusion_time",
+    "diffusion_datetime",
+    "diffusion_channel",
+    "credits_link",
+    "credits_text",
+    "credits_author",
+    "credits_director",
+    "media",
+    "duration_raw",
+    "duration",
+]
+
+MEDIA_FIELDS = [
+    "video_id",
+    "title",
+    "duration",
+    "title_error",
+    "duration_error",
+]
+
+HEADER = json.dumps({
+    "format": MAGIC,
+    "version": VERSION,
+    "fields": FIELDS,
+    "media_fields": MEDIA_FIELDS,
+})
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def entry_to_record(entry):
+    """Map an entry to a JSON lines record"""
+    diffusion_datetime = None
+    if isinstance(entry.diffusion.datetime, datetime.datetime):
+        diffusion_datetime = int(
+            (entry.diffusion.datetime - EPOCH).total_seconds())
+    return [
+        slugify(entry.category.collection),
+        entry.title,
+        entry.category.collection,
+        entry.category.collection_title,
+        entry.category.track_number,
+        entry.category.track_total,
+        entry.category.program,
+        entry.category.genre,
+        entry.diffusion.date,
+        entry.diffusion.time,
+        diffusion_datetime,
+        entry.diffusion.channel,
+        entry.credits.link,
+        entry.credits.text,
+        entry.credits.author,
+        entry.credits.director,
+        [
+            [getattr(video_id, field) for field in MEDIA_FIELDS]
+            for video_id in entry.media.video_ids
+        ],
+        entry.attributes.duration_raw,
+        entry.attributes.duration,
+    ]
+
+
+def intern(value):
+    """Intern a string value, leaving unset (None) values as they are"""
+    if value is None:
+        return None
+    return sys.intern(value)
+
+
+def record_to_entry(record):
+    """Recreate an entry from a JSON lines record"""
+    entry = InaEntry()
+    entry.title = record[1]
+    entry.category.collection = intern(record[2])
+    entry.category.collection_title = intern(record[3])
+    entry.category.track_number = record[4]
+    entry.category.track_total = record[5]
+    entry.category.program = intern(record[6])
+    entry.category.genre = intern(record[7])
+    entry.diffusion.date = record[8]
+    entry.diffusion.time = intern(record[9])
+    if record[10] is None:
+        entry.diffusion.datetime = ""
+    else:
+        entry.diffusion.datetime = EPOCH\
+            + datetime.timedelta(seconds=record[10])
+    entry.diffusion.channel = intern(record[11])
+    entry.credits.link = record[12]
+    entry.credits.text = record[13]
+    entry.credits.author = record[14]
+    entry.credits.director = record[15]
+    entry.media.video_ids = [MediaCandidate(*data) for data in record[16]]
+    entry.attributes.duration_raw = record[17]
+    entry.attributes.duration = record[18]
+    return entry
+
+
+def check_header(line, path):
+    """Make sure the first line of a file is a supported header"""
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != MAGIC:
+        raise ValueError("%s is not a JSON lines entry database" % path)
+    if header.get("version") != VERSION:
+        raise ValueError("Unsupported JSON lines database version %s in %s"
+                         % (header.get("version"), path))
+
+
+def record_slug(decoder, line):
+    """Return the collection slug of a record line, without decoding the
+       rest of it
+    """
+    return decoder.raw_decode(line, 1)[0]
+
+
+def iter_entries(path, collections=None):
+    """Lazily read the entries of a JSON lines database. If a set of
+       collection slugs is given, entries from other collections are skipped
+       before being built.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf8") as file:
+        check_header(file.readline(), path)
+        for line in file:
+            if collections is not None\
+                    and record_slug(decoder, line) not in collections:
+                continue
+            yield record_to_entry(decoder.decode(line))
+
+
+def save_entries(path, database, partial=False):
+    """Write a database to a JSON lines file, and return the number of
+       records written. If partial, the database only holds some of the
+       collections, and the records of the other ones are copied from the
+       existing file as they are. The file is replaced atomically.
+    """
+    n_records, placed = 0, set()
+    decoder = json.JSONDecoder()
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    with atomic_writer(path, "w", encoding="utf8") as file:
+
+        def place(slug):
+            placed.add(slug)
+            for entry in database[slug]:
+                file.write(encoder.encode(entry_to_record(entry)) + "\n")
+            return len(database[slug])
+
+        file.write(HEADER + "\n")
+        if partial and os.path.isfile(path):
+            with open(path, "r", encoding="utf8") as old:
+                check_header(old.readline(), path)
+                for line in old:
+                    slug = record_slug(decoder, line)
+                    if slug not in database:
+                        file.write(line.rstrip("\n") + "\n")
+                        n_records += 1
+                    elif slug not in placed:
+                        n_records += place(slug)
+        for slug in database:
+            if slug not in placed:
+                n_records += place(slug)
+    logging.debug("Wrote %d records to %s", n_records, path)
+    return n_records
+
+
+def append_entries(path, entries):
+    """Append entries to a JSON lines file, creating it with its header
+       first if needed, and return the number of records written
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    exists = os.path.isfile(path) and os.path.getsize(path) > 0
+    if exists:
+        with open(path, "r", encoding="utf8") as file:
+            check_header(file.readline(), path)
+    with open(path, "a", encoding="utf8") as file:
+        if not exists:
+            file.write(HEADER + "\n")
+        for entry in entries:
+            file.write(encoder.encode(entry_to_record(entry)) + "\n")
+    return len(entries)
@@ -0,0 +1,183 @@
+""" Matching module
+
+Provides the automatic assignment of media to the entries of a collection. The
+entries and their candidate videos form a bipartite graph, whose admissible
+edges are the candidates within the error thresholds. Each connected
+component of this graph is solved as an assignment matching as many entries
+as possible, with the minimum total error among those, so that contested
+videos go to the entries they match best instead of the first ones to be
+processed, and no entry is left out to lower the error of another.
+"""
+
+import logging
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+INADMISSIBLE = 1e9
+
+
+class UnionFind:
+    """Disjoint sets of hashable elements"""
+
+    def __init__(self):
+        self.parents = dict()
+
+    def find(self, element):
+        """Return the representative of the set of an element"""
+        root = self.parents.setdefault(element, element)
+        while root != self.parents[root]:
+            root = self.parents[root]
+        while element != root:
+            self.parents[element], element = root, self.parents[element]
+        return root
+
+    def union(self, element_a, element_b):
+        """Merge the sets of two elements"""
+        self.parents[self.find(element_a)] = self.find(element_b)
+
+
+def hungarian(cost):
+    """Solve a rectangular assignment problem with the Hungarian algorithm,
+       with shortest augmenting paths. There must be at least as many columns
+       as rows. Return the column assigned to each row.
+    """
+    rows, cols = len(cost), len(cost[0])
+    u = [0.] * (rows + 1)
+    v = [0.] * (cols + 1)
+    matched = [0] * (cols + 1)
+    way = [0] * (cols + 1)
+    for row in range(1, rows + 1):
+        matched[0] = row
+        col_a = 0
+        min_values = [float("inf")] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[col_a] = True
+            row_a = matched[col_a]
+            delta = float("inf")
+            col_b = 0
+            costs = cost[row_a - 1]
+            for col in range(1, cols + 1):
+                if used[col]:
+                    continue
+                current = costs[col - 1] - u[row_a] - v[col]
+                if current < min_values[col]:
+                    min_values[col] = current
+                    way[col] = col_a
+                if min_values[col] < delta:
+                    delta = min_values[col]
+                    col_b = col
+            for col in range(cols + 1):
+                if used[col]:
+                    u[matched[col]] += delta
+                    v[col] -= delta
+                else:
+                    min_values[col] -= delta
+            col_a = col_b
+            if matched[col_a] == 0:
+                break
+        while col_a != 0:
+            col_b = way[col_a]
+            matched[col_a] = matched[col_b]
+            col_a = col_b
+    assignment = [None] * rows
+    for col in range(1, cols + 1):
+        if matched[col] != 0:
+            assignment[matched[col] - 1] = col - 1
+    return assignment
+
+
+def solve(cost):
+    """Solve an assignment problem, with SciPy if it is installed"""
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+        assignment = [None] * len(cost)
+        for row, col in zip(rows, cols):
+            assignment[row] = col
+        return assignment
+    return hungarian(cost)
+
+
+def admissible_edges(options, entries, allocated):
+    """Return the candidates of entries within the error thresholds, as
+       (entry index, candidate, cost) tuples. Only the best ranked candidates
+       are considered, and videos already allocated are left out.
+    """
+    edges = list()
+    for index, entry in enumerate(entries):
+        best = dict()
+        for candidate in entry.media.video_ids[:options["max-media-candidates"]]:
+            if candidate["video_id"] in allocated\
+                    or candidate["title_error"] >= options["title-error-threshold"]\
+                    or candidate["duration_error"] >= options["duration-error-threshold"]:
+                continue
+            cost = candidate["title_error"] + candidate["duration_error"]
+            if candidate["video_id"] not in best\
+                    or cost < best[candidate["video_id"]][1]:
+                best[candidate["video_id"]] = candidate, cost
+        for candidate, cost in best.values():
+            edges.append((index, candidate, cost))
+    return edges
+
+
+def assign_component(options, edges):
+    """Solve the assignment of one connected component, given its edges, and
+       return a dictionary mapping entry indices to their candidate
+    """
+    entries = sorted(set(index for index, _, _ in edges))
+    videos = sorted(set(candidate["video_id"] for _, candidate, _ in edges))
+    rows = {index: row for row, index in enumerate(entries)}
+    cols = {video_id: col for col, video_id in enumerate(videos)}
+    # One dummy column per entry, for leaving it unassigned. It costs more
+    # than all the edges of the component together, so that matching one
+    # more entry always beats lowering the total error.
+    unassigned = len(entries) * (options["title-error-threshold"]
+                                 + options["duration-error-threshold"]) + 1
+    cost = [
+        [INADMISSIBLE] * len(videos) + [unassigned] * len(entries)
+        for _ in entries
+    ]
+    candidates = dict()
+    for index, candidate, edge_cost in edges:
+        row, col = rows[index], cols[candidate["video_id"]]
+        cost[row][col] = edge_cost
+        candidates[row, col] = candidate
+    assignment = dict()
+    for row, col in enumerate(solve(cost)):
+        if (row, col) in candidates:
+            assignment[entries[row]] = candidates[row, col]
+    return assignment
+
+
+def assign_media(options, entries, allocated):
+    """Assign media to as many entries of a collection as possible, with the
+       minimum total error, and return a dictionary mapping entry indices to their
+       candidate. Assigned videos are added to the allocated set. Entries
+       left out have no admissible candidate, or lost it to a better match
+       when not all of them could be matched.
+    """
+    edges = admissible_edges(options, entries, allocated)
+    sets = UnionFind()
+    for index, candidate, _ in edges:
+        sets.union(("entry", index), ("video", candidate["video_id"]))
+    components = dict()
+    for edge in edges:
+        components.setdefault(sets.find(("entry", edge[0])), list()).append(edge)
+    assignment = dict()
+    for component in components.values():
+        assignment.update(assign_component(options, component))
+    for candidate in assignment.values():
+        allocated.add(candidate["video_id"])
+    logging.info(
+        "Assigned media to %d out of %d entries (%d components, largest "
+        "with %d edges)",
+        len(assignment),
+        len(entries),
+        len(components),
+        max([len(component) for component in components.values()] + [0])
+    )
+    return assignment
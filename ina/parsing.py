@@ -0,0 +1,52 @@
+""" Parsing module
+
+Provides the HTML parsing layer used by the scrapers and the enrichment. The
+fastest installed BeautifulSoup parser is picked, and parsing can be
+restricted to the only part of a document that is read, with a strainer.
+"""
+
+import logging
+from bs4 import BeautifulSoup, FeatureNotFound
+from ina.instrument import timed
+
+
+PARSERS = ["lxml", "html.parser"]
+
+PARSER = None
+
+
+def available_parsers():
+    """Return the names of the installed parsers, fastest first"""
+    parsers = list()
+    for name in PARSERS:
+        try:
+            BeautifulSoup("", name)
+        except FeatureNotFound:
+            continue
+        parsers.append(name)
+    return parsers
+
+
+def set_parser(name=None):
+    """Set the parser to use, or the fastest installed one if None"""
+    global PARSER
+    if name is None or name == "":
+        name = available_parsers()[0]
+    elif name not in available_parsers():
+        raise ValueError("HTML parser '%s' is not installed" % name)
+    logging.debug("Using HTML parser %s", name)
+    PARSER = name
+
+
+@timed("html_parse")
+def make_soup(html, only=None, parser=None):
+    """Parse an HTML document. If only is a SoupStrainer, only the matching
+       elements of the document are parsed.
+    """
+    if parser is None:
+        if PARSER is None:
+            set_parser()
+        parser = PARSER
+    if only is None:
+        return BeautifulSoup(html, parser)
+    return BeautifulSoup(html, parser, parse_only=only)
@@ -0,0 +1,190 @@
+""" Scoring module
+
+Provides the scoring of the media candidates of entries: the duration error
+compares the duration of a candidate with the one of its entry, and the title
+error is the Jaccard distance between their titles. Scores and rankings are
+computed for whole collections at once, with NumPy arrays if it is installed,
+or with plain Python otherwise.
+"""
+
+import functools
+import itertools
+import threading
+from ina.instrument import timed
+from ina.tools import tokenize, CACHE_SIZE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MANUAL_INPUT = "MANUAL_INPUT"
+
+VOCABULARY = dict()
+
+VOCABULARY_LOCK = threading.Lock()
+
+
+def is_vectorized(vectorized=None):
+    """Return whether to use NumPy, defaulting to whether it is installed"""
+    if vectorized is None:
+        return numpy is not None
+    if vectorized and numpy is None:
+        raise ImportError("NumPy is required for vectorized scoring")
+    return vectorized
+
+
+def entry_text(entry):
+    """Return the text media titles are compared to"""
+    return entry.category.collection + " " + entry.title
+
+
+def iter_candidates(entries, manual=True):
+    """Iterate over the media candidates of entries, along with the index of
+       their entry. Manually input candidates are skipped if manual is False.
+    """
+    for index, entry in enumerate(entries):
+        for candidate in entry.media.video_ids:
+            if manual or candidate.title != MANUAL_INPUT:
+                yield index, candidate
+
+
+def duration_error(entry_duration, duration):
+    """Return the relative error of a duration"""
+    if not entry_duration:
+        return 1
+    return abs(duration - entry_duration) / entry_duration
+
+
+def title_error(text, title):
+    """Return the Jaccard distance between two titles"""
+    tokens_a = tokenize(text)
+    tokens_b = tokenize(title)
+    union = len(tokens_a.union(tokens_b))
+    if union == 0:
+        return 1
+    return 1 - len(tokens_a.intersection(tokens_b)) / union
+
+
+@timed("scoring")
+def score_entries(entries, vectorized=None):
+    """Compute the errors of the media candidates of entries, in place, and
+       rank the candidates of each entry, best first. Manually input
+       candidates keep their errors.
+    """
+    if not is_vectorized(vectorized):
+        for index, candidate in iter_candidates(entries, manual=False):
+            entry = entries[index]
+            candidate.duration_error = duration_error(
+                entry.attributes.duration, candidate.duration)
+            candidate.title_error = title_error(
+                entry_text(entry), candidate.title)
+        rank_entries(entries)
+        return
+    owners = [index for index, entry in enumerate(entries)
+              for _ in entry.media.video_ids]
+    if len(owners) == 0:
+        return
+    candidates = [candidate for entry in entries
+                  for candidate in entry.media.video_ids]
+    titles = [candidate.title for candidate in candidates]
+    owners = numpy.array(owners, dtype=numpy.int64)
+    duration_errors = score_durations(entries, candidates, owners)
+    title_errors = score_titles(entries, titles, owners)
+    for i, title in enumerate(titles):
+        if title == MANUAL_INPUT:
+            duration_errors[i] = candidates[i].duration_error
+            title_errors[i] = candidates[i].title_error
+    order = numpy.lexsort((duration_errors, title_errors, owners))
+    ranked = [candidates[i] for i in order.tolist()]
+    for candidate, duration, title in zip(ranked,
+                                          duration_errors[order].tolist(),
+                                          title_errors[order].tolist()):
+        candidate.duration_error = duration
+        candidate.title_error = title
+    start = 0
+    for entry in entries:
+        end = start + len(entry.media.video_ids)
+        entry.media.video_ids = ranked[start:end]
+        start = end
+
+
+def score_durations(entries, candidates, owners):
+    """Return the array of the duration errors of candidates"""
+    entry_durations = numpy.array(
+        [entry.attributes.duration or 0 for entry in entries],
+        dtype=numpy.float64
+    )[owners]
+    durations = numpy.array(
+        [candidate.duration for candidate in candidates],
+        dtype=numpy.float64
+    )
+    errors = numpy.ones(len(candidates))
+    known = entry_durations != 0
+    errors[known] = numpy.abs(durations[known] - entry_durations[known])\
+        / entry_durations[known]
+    return errors
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def text_token_ids(text):
+    """Return the ids of the tokens of a text, as a tuple"""
+    with VOCABULARY_LOCK:
+        return tuple(
+            VOCABULARY.setdefault(token, len(VOCABULARY))
+            for token in tokenize(text)
+        )
+
+
+def token_ids(texts):
+    """Return the concatenated token ids of texts, along with the number of
+       tokens of each text
+    """
+    tuples = list(map(text_token_ids, texts))
+    lengths = numpy.fromiter(map(len, tuples), dtype=numpy.int64,
+                             count=len(tuples))
+    ids = numpy.fromiter(itertools.chain.from_iterable(tuples),
+                         dtype=numpy.int64, count=int(lengths.sum()))
+    return ids, lengths
+
+
+def score_titles(entries, titles, owners):
+    """Return the array of the title errors of candidate titles. Titles are
+       turned into sets of token ids, and each (candidate, token) pair is
+       encoded as a single integer, so that the intersections of all the
+       pairs of token sets are computed at once.
+    """
+    entry_ids, entry_lengths = token_ids(map(entry_text, entries))
+    candidate_ids, candidate_lengths = token_ids(titles)
+    size = max(1, len(VOCABULARY))
+    pairs = numpy.arange(len(titles), dtype=numpy.int64)
+    # Gather the token ids of the entry of each candidate
+    lengths = entry_lengths[owners]
+    starts = (numpy.cumsum(entry_lengths) - entry_lengths)[owners]
+    offsets = numpy.cumsum(lengths) - lengths
+    positions = numpy.arange(int(lengths.sum()), dtype=numpy.int64)\
+        - numpy.repeat(offsets, lengths) + numpy.repeat(starts, lengths)
+    codes_a = numpy.repeat(pairs, lengths) * size + entry_ids[positions]
+    codes_b = numpy.repeat(pairs, candidate_lengths) * size + candidate_ids
+    common = numpy.intersect1d(codes_a, codes_b, assume_unique=True)
+    intersections = numpy.bincount(common // size, minlength=len(titles))
+    unions = lengths + candidate_lengths - intersections
+    errors = numpy.ones(len(titles))
+    known = unions > 0
+    errors[known] = 1 - intersections[known] / unions[known]
+    return errors
+
+
+def rank_entries(entries):
+    """Sort the media candidates of each entry, best first"""
+    for entry in entries:
+        entry.media.video_ids.sort(
+            key=lambda c: (c.title_error, c.duration_error)
+        )
+
+
+def is_accepted(options, candidate):
+    """Return whether a candidate is within the error thresholds"""
+    return candidate.title_error < options["title-error-threshold"]\
+        and candidate.duration_error < options["duration-error-threshold"]
@@ -0,0 +1,179 @@
+""" SQLite module
+
+Provides an SQLite storage backend for the entry database. Each sub-record of
+an entry is mapped to its own columns, and collections are indexed so that
+they can be read and replaced without touching the rest of the database.
+"""
+
+import datetime
+import logging
+import sqlite3
+from ina.database import InaEntry
+from ina.tools import slugify
+
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+COLUMNS = [
+    ("title", "TEXT"),
+    ("collection_slug", "TEXT"),
+    ("collection", "TEXT"),
+    ("collection_title", "TEXT"),
+    ("track_number", "INTEGER"),
+    ("track_total", "INTEGER"),
+    ("program", "TEXT"),
+    ("genre", "TEXT"),
+    ("diffusion_date", "TEXT"),
+    ("diffusion_time", "TEXT"),
+    ("diffusion_datetime", "TEXT"),
+    ("diffusion_channel", "TEXT"),
+    ("credits_link", "TEXT"),
+    ("credits_text", "TEXT"),
+    ("credits_author", "TEXT"),
+    ("credits_director", "TEXT"),
+    ("media", "TEXT"),
+    ("duration_raw", "TEXT"),
+    ("duration", "INTEGER"),
+]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, %s)" % (
+        ", ".join("%s %s" % column for column in COLUMNS)),
+    "CREATE INDEX IF NOT EXISTS entries_collection_slug "
+    "ON entries (collection_slug)",
+    "CREATE INDEX IF NOT EXISTS entries_diffusion_datetime "
+    "ON entries (diffusion_datetime)",
+]
+
+INSERT = "INSERT INTO entries (%s) VALUES (%s)" % (
+    ", ".join(c[0] for c in COLUMNS),
+    ", ".join("?" for _ in COLUMNS)
+)
+
+
+def connect(path):
+    """Open a connection to an SQLite database, creating the schema if
+       needed
+    """
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
+
+
+def entry_to_row(entry):
+    """Map an entry to a row of the entries table"""
+    diffusion_datetime = None
+    if isinstance(entry.diffusion.datetime, datetime.datetime):
+        diffusion_datetime = entry.diffusion.datetime.strftime(DATETIME_FORMAT)
+    return (
+        entry.title,
+        slugify(entry.category.collection),
+        entry.category.collection,
+        entry.category.collection_title,
+        entry.category.track_number,
+        entry.category.track_total,
+        entry.category.program,
+        entry.category.genre,
+        entry.diffusion.date,
+        entry.diffusion.time,
+        diffusion_datetime,
+        entry.diffusion.channel,
+        entry.credits.link,
+        entry.credits.text,
+        entry.credits.author,
+        entry.credits.director,
+        entry.media.serial(),
+        entry.attributes.duration_raw,
+        entry.attributes.duration,
+    )
+
+
+def row_to_entry(row):
+    """Recreate an entry from a row of the entries table"""
+    entry = InaEntry()
+    entry.title = row[0]
+    entry.category.collection = row[2]
+    entry.category.collection_title = row[3]
+    entry.category.track_number = row[4]
+    entry.category.track_total = row[5]
+    entry.category.program = row[6]
+    entry.category.genre = row[7]
+    entry.diffusion.date = row[8]
+    entry.diffusion.time = row[9]
+    if row[10] is None:
+        entry.diffusion.datetime = ""
+    else:
+        entry.diffusion.datetime = datetime.datetime.strptime(
+            row[10], DATETIME_FORMAT)
+    entry.diffusion.channel = row[11]
+    entry.credits.link = row[12]
+    entry.credits.text = row[13]
+    entry.credits.author = row[14]
+    entry.credits.director = row[15]
+    entry.media.from_serial([row[16]])
+    entry.attributes.duration_raw = row[17]
+    entry.attributes.duration = row[18]
+    return entry
+
+
+def iter_entries(path, collections=None):
+    """Yield the entries of an SQLite database, in insertion order. If a set
+       of collection slugs is given, only those collections are read.
+    """
+    connection = connect(path)
+    query = "SELECT %s FROM entries" % ", ".join(c[0] for c in COLUMNS)
+    parameters = list()
+    if collections is not None:
+        parameters = sorted(collections)
+        query += " WHERE collection_slug IN (%s)" % ", ".join(
+            "?" for _ in parameters)
+    query += " ORDER BY id"
+    try:
+        for row in connection.execute(query, parameters):
+            yield row_to_entry(row)
+    finally:
+        connection.close()
+
+
+def save_entries(path, database, partial=False):
+    """Write a database to an SQLite file within a single transaction. If
+       partial, only the collections of the database are replaced, otherwise
+       the whole table is.
+    """
+    connection = connect(path)
+    n_rows = 0
+    try:
+        with connection:
+            if partial:
+                connection.executemany(
+                    "DELETE FROM entries WHERE collection_slug = ?",
+                    [(slug,) for slug in database]
+                )
+            else:
+                connection.execute("DELETE FROM entries")
+            for slug in database:
+                connection.executemany(
+                    INSERT,
+                    (entry_to_row(entry) for entry in database[slug])
+                )
+                n_rows += len(database[slug])
+    finally:
+        connection.close()
+    logging.debug("Inserted %d rows in %s", n_rows, path)
+    return n_rows
+
+
+def append_entries(path, entries):
+    """Insert entries at the end of an SQLite database within a single
+       transaction, and return the number of rows inserted
+    """
+    connection = connect(path)
+    try:
+        with connection:
+            connection.executemany(
+                INSERT, (entry_to_row(entry) for entry in entries))
+    finally:
+        connection.close()
+    return len(entries)
@@ -1,9 +1,17 @@
 """Tools for INA"""
 
+import os
 import re
 import time
+import shutil
 import logging
+import tempfile
+import functools
+import contextlib
+import threading
+import collections
 import unicodedata
+import urllib.parse
 
 
 NON_URL_SAFE = ["\"", "#", "$", "%", "&", "+", ",", "/", ":", ";", "=", "?",
@@ -12,6 +20,12 @@ NON_URL_SAFE = ["\"", "#", "$", "%", "&", "+", ",", "/", ":", ";", "=", "?",
 NON_URL_SAFE_REGEX = re.compile(r"[{}]".format(
     "".join(re.escape(x) for x in NON_URL_SAFE)))
 
+NON_URL_SAFE_TABLE = str.maketrans("", "", "".join(NON_URL_SAFE))
+
+CACHE_SIZE = 65536
+
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def strip_accents(string):
     """Switch accented characters to normal characters in a string"""
@@ -21,30 +35,159 @@ def strip_accents(string):
     )
 
 
+def is_ascii(string):
+    """Return whether a string only contains ASCII characters"""
+    try:
+        string.encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
 def slugify(string):
     """Return a unicode url-safe version of the input string"""
-    return strip_accents("-".join(re.split(
-        r"\s+",
-        NON_URL_SAFE_REGEX.sub("", string.lower()).strip()
-    )))
-
-
-def timed_loop(iterator, delay):
-    """Iterator wrapper that makes sure each loop is spaced in time"""
-    for i in iterator:
-        last_loop = time.time()
-        yield i
-        time_since_last_loop = time.time() - last_loop
-        time_to_wait = max(0, delay - time_since_last_loop)
+    slug = "-".join(string.lower().translate(NON_URL_SAFE_TABLE).split())
+    if is_ascii(slug):
+        return slug
+    return strip_accents(slug)
+
+
+class TokenBucket:
+    """Thread-safe token bucket, refilled at a given rate (in tokens per
+       second) up to its capacity
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Consume a token, waiting for it to be available if needed"""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            time_to_wait = max(0, -self.tokens / self.rate)
         time.sleep(time_to_wait)
 
+    def set_rate(self, rate):
+        """Change the rate, the tokens until now being refilled at the
+           previous one
+        """
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+
+class HostRateLimiter:
+    """Rate limiter with one token bucket per host, so that requests to
+       different hosts do not wait for each other
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.buckets = dict()
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """Wait until a request to the URL's host is allowed"""
+        if self.delay <= 0:
+            return
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(1 / self.delay)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+    def feedback(self, url, latency, error=False):
+        """Report how a request to the URL's host went. The delay is fixed,
+           so this does nothing.
+        """
+
+
+class AdaptiveRateLimiter(HostRateLimiter):
+    """Rate limiter whose delay, for each host, shrinks while responses are
+       fast and successful, and doubles on errors (such as HTTP 429 or 5xx)
+       or slow responses, within a floor and a ceiling
+    """
+
+    def __init__(self, delay, min_delay, max_delay, slow_latency=5.,
+                 speedup=.9):
+        HostRateLimiter.__init__(self, delay)
+        self.min_delay = min(min_delay, delay)
+        self.max_delay = max(max_delay, delay)
+        self.slow_latency = slow_latency
+        self.speedup = speedup
+        self.delays = dict()
+
+    def wait(self, url):
+        """Wait until a request to the URL's host is allowed"""
+        if self.max_delay <= 0:
+            return
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                self.delays[host] = self.delay
+                bucket = TokenBucket(1 / max(self.delay, 1e-3))
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+    def feedback(self, url, latency, error=False):
+        """Report how a request to the URL's host went, adapting its delay"""
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                return
+            delay = self.delays[host]
+            if error or latency > self.slow_latency:
+                delay = min(self.max_delay, max(delay, 1e-3) * 2)
+            else:
+                delay = max(self.min_delay, delay * self.speedup)
+            if delay != self.delays[host]:
+                logging.debug("Delay for %s is now %.3f seconds", host, delay)
+            self.delays[host] = delay
+            bucket = self.buckets[host]
+        bucket.set_rate(1 / max(delay, 1e-3))
+
+
+def ordered_map(executor, function, iterator, window):
+    """Map a function over an iterator with an executor, yielding results in
+       order, with at most window tasks submitted ahead of the consumer
+    """
+    futures = collections.deque()
+    try:
+        for value in iterator:
+            futures.append(executor.submit(function, value))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while len(futures) > 0:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
 
 STOPWORDS = set(["le", "la", "les", "l", "un", "une", "des"])
 
 
+@functools.lru_cache(maxsize=CACHE_SIZE)
 def tokenize(string):
     """Tokenize a string"""
-    return set(slugify(string).split("-")).difference(STOPWORDS)
+    return frozenset(slugify(string).split("-")).difference(STOPWORDS)
 
 
 def jaccard(string_a, string_b):
@@ -78,3 +221,38 @@ def tracked_loop(iterator, total, titler):
             titler(value)
         )
         yield value
+
+
+@contextlib.contextmanager
+def atomic_writer(path, mode="wb", **kwargs):
+    """Context manager opening a temporary file next to path, with a large
+       write buffer. When the context exits normally, the file is flushed to
+       the disk and atomically renamed over path, so that path always holds
+       either its previous content or the whole new one. The file keeps the
+       permissions of the previous one, or gets the default ones.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, mode, WRITE_BUFFER_SIZE, **kwargs) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.isfile(path):
+            shutil.copymode(path, temp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        directory_descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
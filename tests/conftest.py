@@ -0,0 +1,37 @@
+"""Shared fixtures of the tests"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def free_port():
+    """Return a TCP port nobody listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def fixture_server():
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(FIXTURES, "server.py"), str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), 1).close()
+                break
+            except OSError:
+                time.sleep(.05)
+        yield "http://127.0.0.1:%d" % port
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,25 @@
+"""Streaming clean must write the same database as the in-memory clean"""
+
+import os
+import shutil
+import benchmark
+from ina.database import clean
+
+
+def clean_copy(source, path, streaming):
+    """Clean a copy of a database, and return the bytes written"""
+    shutil.copyfile(source, path)
+    clean(benchmark.database_options(path, streaming=streaming))
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_streaming_clean_is_identical(tmpdir):
+    source = os.path.join(str(tmpdir), "source.tsv")
+    path = os.path.join(str(tmpdir), "database.tsv")
+    benchmark.write_database(source, benchmark.synthetic_entries(2000))
+    in_memory = clean_copy(source, path, False)
+    streaming = clean_copy(source, path, True)
+    assert streaming == in_memory
+    with open(source, "rb") as file:
+        assert len(in_memory) < len(file.read())
@@ -0,0 +1,40 @@
+"""Appending to a database must keep it readable, whatever its format"""
+
+import os
+import pytest
+import benchmark
+from ina.database import append_database, database_format, load_database
+
+
+def load_keys(path):
+    """Return the keys of the entries of a database, in collection order"""
+    database = load_database(benchmark.database_options(path))
+    return [entry.key() for slug in database for entry in database[slug]]
+
+
+@pytest.mark.parametrize("filename, expected_format", [
+    ("database.tsv", "tsv"),
+    ("database.jsonl", "jsonl"),
+    ("database.sqlite", "sqlite"),
+])
+def test_append_to_each_format(tmpdir, filename, expected_format):
+    path = os.path.join(str(tmpdir), filename)
+    options = benchmark.database_options(path)
+    entries = benchmark.synthetic_entries(300)
+    assert append_database(options, list()) == 0
+    assert database_format(path) == expected_format
+    assert load_keys(path) == list()
+    assert append_database(options, entries[:200]) == 200
+    assert append_database(options, entries[200:]) == 100
+    assert database_format(path) == expected_format
+    assert sorted(load_keys(path)) == sorted(e.key() for e in entries)
+
+
+def test_append_unset_fields(tmpdir):
+    path = os.path.join(str(tmpdir), "database.jsonl")
+    entry, = benchmark.synthetic_entries(1)
+    entry.category.collection_title = None
+    entry.category.track_number = None
+    entry.category.track_total = None
+    append_database(benchmark.database_options(path), [entry])
+    assert load_keys(path) == [entry.key()]
@@ -0,0 +1,127 @@
+"""The fetch engine must serve the fixture pages, reusing its connections,
+   resend at once requests that met a connection closed while idle, and
+   serve expired cached responses in offline mode
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+import pytest
+from ina.cache import ResponseCache
+from ina.fetch import FetchEngine, Response, CacheMissException
+
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+PAGES = [
+    ("/", "search.html"),
+    ("/recherche?page=2", "results.html"),
+    ("/notice?id=1", "notice.html"),
+    ("/results?search_query=a", "youtube_results.html"),
+]
+
+
+class RecordingLimiter:
+    """Rate limiter that does not wait, and counts failed requests"""
+
+    def __init__(self):
+        self.errors = 0
+
+    def wait(self, url):
+        """Never wait"""
+
+    def feedback(self, url, latency, error=False):
+        """Count the failures"""
+        self.errors += error
+
+
+def read_fixture(filename):
+    """Return the content of a fixture page"""
+    with open(os.path.join(FIXTURES, filename), "rb") as file:
+        return file.read()
+
+
+def test_fetch_fixture_pages(fixture_server):
+    engine = FetchEngine(timeout=5, retries=0, max_connections=2,
+                         resolve={"inatheque.ina.fr": fixture_server})
+    try:
+        urls = ["http://inatheque.ina.fr" + path for path, _ in PAGES] * 5
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(engine.fetch, urls))
+        for url, response in zip(urls, responses):
+            filename = dict(PAGES)[url[len("http://inatheque.ina.fr"):]]
+            assert response.status == 200
+            assert response.body == read_fixture(filename)
+        response = engine.fetch("http://inatheque.ina.fr/recherche",
+                                method="POST", body=b"q=a")
+        assert response.body == read_fixture("results.html")
+        pool, = engine.pools.values()
+        assert len(pool.connections) <= 2
+    finally:
+        engine.close()
+
+
+async def serve_until_idle(reader, writer):
+    """Answer requests, closing the connection once idle for 0.2 second"""
+    while True:
+        try:
+            line = await asyncio.wait_for(reader.readline(), .2)
+        except asyncio.TimeoutError:
+            break
+        if line == b"":
+            break
+        while await reader.readline() not in (b"\r\n", b""):
+            pass
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+    writer.close()
+
+
+@pytest.fixture
+def idle_server():
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(serve_until_idle, "127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.daemon = True
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+
+
+def test_resend_on_stale_connection(idle_server):
+    limiter = RecordingLimiter()
+    engine = FetchEngine(timeout=5, retries=1, backoff=10., max_connections=1,
+                         limiter=limiter)
+    try:
+        start = time.time()
+        for i in range(3):
+            response = engine.fetch("%s/%d" % (idle_server, i))
+            assert response.body == b"ok"
+            time.sleep(.4)
+        assert time.time() - start < 3
+        assert limiter.errors == 0
+    finally:
+        engine.close()
+
+
+def test_offline_serves_expired_responses(tmpdir):
+    cache = ResponseCache(str(tmpdir), ttl=1)
+    url = "http://inatheque.ina.fr/notice?id=1"
+    cache.put(url, Response(url, 200, dict(), b"ok"))
+    expired = time.time() - 10
+    os.utime(cache.path(url), (expired, expired))
+    assert cache.get(url) is None
+    engine = FetchEngine(cache=cache, offline=True)
+    try:
+        assert engine.fetch(url).body == b"ok"
+        with pytest.raises(CacheMissException):
+            engine.fetch("http://inatheque.ina.fr/notice?id=2")
+    finally:
+        engine.close()
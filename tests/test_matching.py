@@ -0,0 +1,68 @@
+"""The pure-Python Hungarian solver must find SciPy's optimum, and media
+   assignment must match every entry that can be matched
+"""
+
+import random
+import pytest
+from ina import matching
+from ina.database import InaEntry, MediaCandidate
+from ina.matching import hungarian
+
+scipy_optimize = pytest.importorskip("scipy.optimize")
+
+
+def total_cost(cost, assignment):
+    """Return the cost of an assignment of columns to rows"""
+    return sum(cost[row][col] for row, col in enumerate(assignment))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_hungarian_matches_scipy(seed):
+    rand = random.Random(seed)
+    rows = rand.randint(1, 8)
+    cols = rand.randint(rows, 10)
+    cost = [[rand.choice([rand.random(), float(rand.randint(0, 3))])
+             for _ in range(cols)] for _ in range(rows)]
+    assignment = hungarian(cost)
+    assert len(set(assignment)) == rows
+    assert all(0 <= col < cols for col in assignment)
+    expected_rows, expected_cols = scipy_optimize.linear_sum_assignment(cost)
+    expected = sum(cost[row][col]
+                   for row, col in zip(expected_rows, expected_cols))
+    assert total_cost(cost, assignment) == pytest.approx(expected)
+
+
+OPTIONS = {
+    "max-media-candidates": 2,
+    "title-error-threshold": .5,
+    "duration-error-threshold": .05,
+}
+
+
+def chain_entries(size, seed):
+    """Return entries where entry i has videos i and i + 1 as candidates,
+       which can always all be matched
+    """
+    rand = random.Random(seed)
+    entries = list()
+    for i in range(size):
+        entry = InaEntry()
+        entry.media.video_ids = [
+            MediaCandidate(video_id="v%d" % j,
+                           title_error=rand.random() * .5,
+                           duration_error=rand.random() * .05)
+            for j in (i, i + 1)
+        ]
+        entries.append(entry)
+    return entries
+
+
+@pytest.mark.parametrize("vectorized, size", [(True, 2000), (False, 100)])
+def test_assign_media_matches_every_entry(monkeypatch, vectorized, size):
+    if not vectorized:
+        monkeypatch.setattr(matching, "linear_sum_assignment", None)
+    for seed in range(3):
+        entries = chain_entries(size, seed)
+        assignment = matching.assign_media(OPTIONS, entries, set())
+        assert len(assignment) == size
+        assert len(set(c["video_id"] for c in assignment.values())) == size
@@ -0,0 +1,52 @@
+"""Scraping the fixture pages must write results in the format of the
+   database, when resetting it, appending to it or scraping incrementally
+"""
+
+import os
+import subprocess
+import sys
+import pytest
+import benchmark
+from ina.database import database_format, load_database
+
+INA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ina.py")
+
+COLLECTION = "les-maitres-du-mystere"
+
+
+def scrap(server, path, *flags):
+    """Scrap the fixture result pages into a database"""
+    subprocess.check_call(
+        [sys.executable, INA, "scrap", "-d", path, "-q", "maitres",
+         "-c", COLLECTION, "-H", "inatheque.ina.fr=" + server,
+         "-y", "-w", "0", "-n", "0"] + list(flags),
+        cwd=os.path.dirname(path),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def count_entries(path):
+    """Return the number of entries of the scraped collection"""
+    database = load_database(benchmark.database_options(path))
+    return len(database.get(COLLECTION, list()))
+
+
+@pytest.mark.parametrize("filename, expected_format", [
+    ("database.tsv", "tsv"),
+    ("database.jsonl", "jsonl"),
+    ("database.sqlite", "sqlite"),
+])
+def test_scrap_each_format(fixture_server, tmpdir, filename,
+                           expected_format):
+    path = os.path.join(str(tmpdir), filename)
+    with open(path, "w") as file:
+        file.write("not a database\n")
+    scrap(fixture_server, path)
+    assert database_format(path) == expected_format
+    pages = count_entries(path)
+    assert pages > 0
+    scrap(fixture_server, path, "-i")
+    assert count_entries(path) == pages
+    scrap(fixture_server, path, "-a")
+    assert count_entries(path) == 2 * pages
+    assert database_format(path) == expected_format
@@ -0,0 +1,39 @@
+"""The memoized slugify must match the regular expression version it
+   replaced
+"""
+
+import random
+import re
+import unicodedata
+from ina.tools import slugify
+
+NON_URL_SAFE = ["\"", "#", "$", "%", "&", "+", ",", "/", ":", ";", "=", "?",
+                "@", "[", "\\", "]", "^", "`", "{", "|", "}", "~", "'", "!"]
+
+NON_URL_SAFE_REGEX = re.compile(r"[{}]".format(
+    "".join(re.escape(x) for x in NON_URL_SAFE)))
+
+ALPHABET = "".join(NON_URL_SAFE)\
+    + " \t\n\r\x0b\x0c\x1c\x85\xa0\u2003\u3000-_.()*"\
+    + "abcXYZ019\xe9\xe8\xea\xeb\xe0\xe2\xe4\xee\xef\xf4\xf6\xf9\xfb\xfc\xe7"\
+    + "\xc9\xc8\xc0\xc7\u0153\u0152\xe6\xdf\ufb01\u0327\u0301"\
+    + "\u03a3\u03c3\u03c2\u0130\u0132"
+
+
+def reference_slugify(string):
+    """slugify as it was before being memoized"""
+    return "".join(
+        char for char in unicodedata.normalize("NFD", "-".join(re.split(
+            r"\s+",
+            NON_URL_SAFE_REGEX.sub("", string.lower()).strip()
+        )))
+        if unicodedata.category(char) != "Mn"
+    )
+
+
+def test_slugify_matches_reference():
+    rand = random.Random(0)
+    for _ in range(20000):
+        string = "".join(rand.choice(ALPHABET)
+                         for _ in range(rand.randint(0, 20)))
+        assert slugify(string) == reference_slugify(string), repr(string)
@@ -1,8 +1,10 @@
 """
 Shift track ids, set the album cover and set a default album artist.
+Files whose tags and cover are already set are left untouched. Files are
+processed by a pool of worker processes, one per CPU by default.
 
 Usage:
-    python unify.py [album_artist] [album_art] [folder]
+    python unify.py [album_artist] [album_art] [folder] ([workers])
 """
 
 
@@ -10,10 +12,66 @@ import os
 import sys
 import glob
 import logging
+import functools
+import concurrent.futures
 import eyed3
 from ina.tools import tracked_loop
 
 
+FRONT_COVER = 3
+
+
+@functools.lru_cache(maxsize=1)
+def read_image(album_art):
+    """Read the album cover, once per worker process"""
+    with open(album_art, "rb") as file:
+        return file.read()
+
+
+def has_cover(tag, image, description):
+    """Return whether a tag already holds the album cover"""
+    for frame in tag.images:
+        if frame.picture_type == FRONT_COVER\
+                and frame.mime_type == "image/jpeg"\
+                and frame.description == description\
+                and frame.image_data == image:
+            return True
+    return False
+
+
+def unify_file(filename, track_num, album_artist, album_art):
+    """Set the tags and the cover of a file, and return whether it had to be
+       saved. The tag is written in place when it fits in the padding of the
+       existing one, so the audio payload is only rewritten when it grows.
+    """
+    audiofile = eyed3.load(filename)
+    if audiofile is None:
+        logging.warning("Could not load %s", filename)
+        return False
+    if audiofile.tag is None:
+        audiofile.initTag()
+    tag = audiofile.tag
+    image = read_image(album_art)
+    description = tag.album or ""
+    if tag.artist is not None\
+            and tag.album_artist == album_artist\
+            and tuple(tag.track_num) == track_num\
+            and has_cover(tag, image, description):
+        return False
+    if tag.artist is None:
+        tag.artist = album_artist
+    tag.album_artist = album_artist
+    tag.track_num = track_num
+    tag.images.set(FRONT_COVER, image, "image/jpeg", description)
+    tag.save()
+    return True
+
+
+def unify_task(args):
+    """Unpack the arguments of unify_file, for the worker processes"""
+    return unify_file(*args)
+
+
 def main():
     """Main module function"""
     logging.basicConfig(
@@ -23,26 +81,35 @@ def main():
     if len(sys.argv) < 4:
         print(__doc__)
         sys.exit()
-    album_artist, album_art, folder = sys.argv[1:]
-    with open(album_art, "rb") as file:
-        image = file.read()
+    album_artist, album_art, folder = sys.argv[1:4]
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
     filenames = glob.glob(os.path.join(folder, "*.mp3"))
     filenames.sort()
     total = len(filenames)
-    for i, filename in enumerate(tracked_loop(filenames, total, lambda s: s)):
-        audiofile = eyed3.load(filename)
-        if audiofile.tag.artist is None:
-            audiofile.tag.artist = album_artist
-        audiofile.tag.album_artist = album_artist
-        audiofile.tag.track_num = i + 1, total
-        audiofile.tag.track_number = total
-        audiofile.tag.images.set(
-            3,
-            image,
-            "image/jpeg",
-            audiofile.tag.album
+    tasks = [
+        (filename, (i + 1, total), album_artist, album_art)
+        for i, filename in enumerate(filenames)
+    ]
+    if workers <= 1:
+        results = map(unify_task, tasks)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(
+            unify_task,
+            tasks,
+            chunksize=max(1, total // (4 * workers))
         )
-        audiofile.tag.save()
+    saved = 0
+    try:
+        for filename, was_saved in tracked_loop(
+                zip(filenames, results), total, lambda s: s[0]):
+            saved += was_saved
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    logging.info("Saved %d files, %d were already unified",
+                 saved, total - saved)
 
 
 if __name__ == "__main__":